@@ -1,2 +1,9 @@
 from .db import game_db, BgGameDatabase
-from .bg_game_utilities import get_image_grid, get_preview
\ No newline at end of file
+from .asset_fetcher import asset_fetcher, AssetFetcher, AssetUnavailableError
+from .tile_cache import tile_cache, TileCache
+from .render import render_executor, RenderExecutor
+from .bg_game_utilities import get_image_grid, get_preview, MissingAssetError
+from .asset_validator import asset_validator, AssetValidator
+from .ingest import play_history_ingestor, PlayHistoryIngestor
+from .mapset_index import played_set_index, PlayedSetIndex
+from .phash_index import phash_index, PhashIndex
\ No newline at end of file
@@ -0,0 +1,83 @@
+import asyncio
+import aiohttp
+from typing import Any, List, Optional
+
+
+class AssetUnavailableError(Exception):
+    # The asset may well exist, it just couldn't be fetched right now, e.g. timeouts or server errors that outlasted the retries
+    def __init__(self, url: str, reason: str) -> None:
+        super().__init__(f"Could not fetch {url}: {reason}")
+        self.url: str = url
+
+
+class AssetFetcher:
+    _instance: Optional['AssetFetcher'] = None
+
+    def __init__(self, timeout: float = 10, retries: int = 2, retry_delay: float = 0.5, max_connections: int = 16) -> None:
+        self.timeout: aiohttp.ClientTimeout = aiohttp.ClientTimeout(total=timeout)
+        self.retries: int = retries
+        self.retry_delay: float = retry_delay
+        self.max_connections: int = max_connections
+        self.session: Optional[aiohttp.ClientSession] = None
+
+    def get_session(self) -> aiohttp.ClientSession:
+        # One keep-alive session for the whole bot, created lazily inside the running loop
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=60)
+            self.session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        return self.session
+
+    async def fetch(self, url: str) -> Optional[bytes]:
+        return await self.request("GET", url)
+
+    async def probe(self, url: str) -> Optional[int]:
+        # Size of an asset without downloading it, None if it doesn't exist. Like fetch, raises AssetUnavailableError when that can't be told
+        size: Optional[int] = await self.request("HEAD", url)
+        if size == -1:
+            content = await self.fetch(url)
+            return None if content is None else len(content)
+        return size
+
+    async def request(self, method: str, url: str) -> Any:
+        # None only when the server says the asset doesn't exist, anything else that isn't a 200 raises AssetUnavailableError
+        session = self.get_session()
+        reason: str = ""
+
+        for attempt in range(self.retries + 1):
+            try:
+                async with session.request(method, url) as r:
+                    if r.status == 200:
+                        if method == "HEAD":
+                            return r.content_length if r.content_length is not None else -1
+                        return await r.read()
+                    if r.status in (404, 410):
+                        return None
+                    reason = f"status {r.status}"
+                    # Other client errors won't change on a retry, only throttling and server errors might clear up
+                    if r.status != 429 and r.status < 500:
+                        raise AssetUnavailableError(url, reason)
+                    print(f"Fetching {url} failed with {reason} (attempt {attempt + 1})")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                reason = repr(e)
+                print(f"Fetching {url} failed: {reason} (attempt {attempt + 1})")
+
+            if attempt < self.retries:
+                await asyncio.sleep(self.retry_delay * 2 ** attempt)
+
+        raise AssetUnavailableError(url, reason)
+
+    async def fetch_many(self, urls: List[str]) -> List[Optional[bytes]]:
+        return list(await asyncio.gather(*(self.fetch(url) for url in urls)))
+
+    async def close(self) -> None:
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+        self.session = None
+
+    @classmethod
+    def get_instance(cls) -> 'AssetFetcher':
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+asset_fetcher = AssetFetcher.get_instance()
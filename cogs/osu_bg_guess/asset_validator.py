@@ -0,0 +1,86 @@
+import time
+import random
+import asyncio
+from typing import List, Optional, Set, Tuple
+from .db import game_db
+from .asset_fetcher import asset_fetcher, AssetUnavailableError
+from .bg_game_utilities import get_bg_url, get_preview_url, MIN_PREVIEW_SIZE
+
+
+class AssetValidator:
+    _instance: Optional['AssetValidator'] = None
+
+    def __init__(self, concurrency: int = 8, batch_size: int = 100, max_age: float = 3 * 24 * 60 * 60) -> None:
+        self.semaphore: asyncio.Semaphore = asyncio.Semaphore(concurrency)
+        self.batch_size: int = batch_size
+        self.max_age: float = max_age
+        self.queued: Set[int] = set()
+        self.task: Optional[asyncio.Task] = None
+
+    async def check(self, set_id: int) -> Optional[Tuple[int, bool, bool, int, int, float]]:
+        async with self.semaphore:
+            try:
+                bg_size, preview_size = await asyncio.gather(
+                    asset_fetcher.probe(get_bg_url(set_id)),
+                    asset_fetcher.probe(get_preview_url(set_id))
+                )
+            except AssetUnavailableError:
+                # Nothing is recorded, the set stays unchecked and is tried again later
+                return None
+        return (set_id, bg_size is not None, (preview_size or 0) >= MIN_PREVIEW_SIZE, bg_size or 0, preview_size or 0, time.time())
+
+    async def validate(self, set_ids: List[int]) -> None:
+        for i in range(0, len(set_ids), self.batch_size):
+            rows = await asyncio.gather(*(self.check(set_id) for set_id in set_ids[i:i + self.batch_size]))
+            await game_db.add_mapset_assets_batch([row for row in rows if row is not None])
+
+    async def get_unchecked(self, set_ids: List[int]) -> List[int]:
+        checked: Set[int] = await game_db.get_checked_sets(time.time() - self.max_age)
+        return [set_id for set_id in set_ids if set_id not in checked]
+
+    async def get_playable(self, set_ids: List[int], needed: int) -> List[int]:
+        # Validates just enough unknown sets to fill a game, the rest is left to the background queue
+        unchecked: List[int] = await self.get_unchecked(set_ids)
+        random.shuffle(unchecked)
+
+        valid: Set[int] = await game_db.get_valid_sets()
+        playable: List[int] = [set_id for set_id in set_ids if set_id in valid]
+        # Sets that were valid when last checked but are due a recheck are already in playable
+        counted: Set[int] = set(playable)
+
+        while len(playable) < needed and unchecked:
+            batch, unchecked = unchecked[:self.batch_size], unchecked[self.batch_size:]
+            await self.validate(batch)
+            valid = await game_db.get_valid_sets()
+            playable += [set_id for set_id in batch if set_id in valid and set_id not in counted]
+            counted.update(batch)
+
+        self.queue(unchecked)
+        return playable
+
+    def queue(self, set_ids: List[int]) -> None:
+        self.queued.update(set_ids)
+        if self.queued and (self.task is None or self.task.done()):
+            self.task = asyncio.create_task(self.run())
+
+    async def run(self) -> None:
+        while self.queued:
+            batch: List[int] = [self.queued.pop() for _ in range(min(self.batch_size, len(self.queued)))]
+            try:
+                await self.validate(batch)
+            except Exception as e:
+                print(f"Asset validation failed: {e!r}")
+        print("Finished validating queued mapset assets")
+
+    async def mark_invalid(self, set_id: int, bg: bool = False, preview: bool = False) -> None:
+        # Assets found missing while preparing a round, so the set isn't sampled again until it is rechecked.
+        # Only for definite 404s, a fetch that merely failed raises AssetUnavailableError instead
+        await game_db.mark_mapset_asset_missing(set_id, bg=bg, preview=preview)
+
+    @classmethod
+    def get_instance(cls) -> 'AssetValidator':
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+asset_validator = AssetValidator.get_instance()
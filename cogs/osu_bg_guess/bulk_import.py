@@ -0,0 +1,140 @@
+import csv
+import sys
+import gzip
+import time
+import sqlite3
+import argparse
+from typing import Dict, Iterator, List, Optional, Sequence, TextIO, Tuple
+from .db import DEFAULT_PATH, create_schema
+
+# Safe to lose on a crash since the whole import can just be rerun, the bot must not be running while these are set
+IMPORT_PRAGMAS: List[str] = [
+    "PRAGMA synchronous=OFF",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-262144",
+    "PRAGMA busy_timeout=5000",
+]
+
+
+def open_dump(path: str) -> TextIO:
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", newline="", encoding="utf-8")
+    return open(path, newline="", encoding="utf-8")
+
+
+def get_delimiter(path: str, delimiter: Optional[str]) -> str:
+    if delimiter:
+        return delimiter.encode().decode("unicode_escape")
+    return "," if path.removesuffix(".gz").endswith(".csv") else "\t"
+
+
+def get_column(header: Optional[Sequence[str]], column: str) -> int:
+    if column.isdigit():
+        return int(column)
+    if header is None or column not in header:
+        raise SystemExit(f"Column {column!r} not found, available columns: {', '.join(header or [])}")
+    return list(header).index(column)
+
+
+def read_pairs(path: str, left: str, right: str, delimiter: Optional[str], has_header: bool) -> Iterator[Tuple[int, int]]:
+    # Streams (left, right) integer pairs out of a dump, rows that don't parse are skipped
+    with open_dump(path) as f:
+        reader = csv.reader(f, delimiter=get_delimiter(path, delimiter))
+        header: Optional[List[str]] = next(reader, None) if has_header else None
+        left_index, right_index = get_column(header, left), get_column(header, right)
+        for row in reader:
+            try:
+                yield int(row[left_index]), int(row[right_index])
+            except (ValueError, IndexError):
+                continue
+
+
+def load_beatmap_map(args: argparse.Namespace) -> Dict[int, int]:
+    start: float = time.perf_counter()
+    beatmap_map: Dict[int, int] = dict(read_pairs(args.beatmap_map, args.map_beatmap_column, args.map_mapset_column, None, not args.no_header))
+    print(f"Loaded {len(beatmap_map):,} beatmap -> mapset ids in {time.perf_counter() - start:.1f}s")
+    return beatmap_map
+
+
+def get_plays(args: argparse.Namespace, beatmap_map: Optional[Dict[int, int]]) -> Iterator[Tuple[int, int]]:
+    for path in args.files:
+        print(f"Reading {path}")
+        if beatmap_map is None:
+            yield from read_pairs(path, args.user_column, args.mapset_column, args.delimiter, not args.no_header)
+            continue
+        for osu_id, beatmap_id in read_pairs(path, args.user_column, args.beatmap_column, args.delimiter, not args.no_header):
+            mapset_id: Optional[int] = beatmap_map.get(beatmap_id)
+            if mapset_id is not None:
+                yield osu_id, mapset_id
+
+
+def bulk_import(args: argparse.Namespace) -> None:
+    beatmap_map: Optional[Dict[int, int]] = load_beatmap_map(args) if args.beatmap_map else None
+
+    conn: sqlite3.Connection = sqlite3.connect(args.db, isolation_level=None)
+    for pragma in IMPORT_PRAGMAS:
+        conn.execute(pragma)
+    c: sqlite3.Cursor = conn.cursor()
+    # The target may be a fresh file rather than the bot's database
+    create_schema(c)
+
+    # Keeping the secondary index up to date row by row is most of the cost, rebuilding it once at the end is far cheaper
+    c.execute("DROP INDEX IF EXISTS idx_play_history_mapset_id")
+
+    start: float = time.perf_counter()
+    rows_read: int = 0
+    rows_added: int = 0
+    chunk: List[Tuple[int, int]] = []
+
+    def flush() -> None:
+        nonlocal rows_read, rows_added
+        changes: int = conn.total_changes
+        c.execute("BEGIN")
+        c.executemany("INSERT OR IGNORE INTO play_history (osu_id, mapset_id) VALUES (?, ?)", chunk)
+        c.execute("COMMIT")
+        rows_read += len(chunk)
+        rows_added += conn.total_changes - changes
+        chunk.clear()
+        elapsed: float = time.perf_counter() - start
+        print(f"{rows_read:,} rows read, {rows_added:,} new plays, {rows_read / elapsed:,.0f} rows/s", end="\r")
+
+    try:
+        for play in get_plays(args, beatmap_map):
+            chunk.append(play)
+            if len(chunk) >= args.chunk_size:
+                flush()
+        if chunk:
+            flush()
+        print()
+    finally:
+        index_start: float = time.perf_counter()
+        c.execute("CREATE INDEX IF NOT EXISTS idx_play_history_mapset_id ON play_history(mapset_id)")
+        c.execute("ANALYZE play_history")
+        c.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        print(f"Rebuilt indexes in {time.perf_counter() - index_start:.1f}s")
+        conn.close()
+
+    elapsed: float = time.perf_counter() - start
+    print(f"Imported {rows_added:,} new plays from {rows_read:,} rows in {elapsed:.1f}s ({rows_read / max(elapsed, 1e-9):,.0f} rows/s)")
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m cogs.osu_bg_guess.bulk_import",
+        description="Seed play_history from TSV/CSV dumps (optionally gzipped). Stop the bot before running this.")
+    parser.add_argument("files", nargs="+", help="dump files, one play per row")
+    parser.add_argument("--db", default=DEFAULT_PATH, help="database to import into (default: %(default)s)")
+    parser.add_argument("--delimiter", help="field delimiter of the dump files, defaults to ',' for .csv and tab otherwise")
+    parser.add_argument("--no-header", action="store_true", help="files have no header row, columns are given by index")
+    parser.add_argument("--user-column", default="user_id", help="column holding the osu! user id (default: %(default)s)")
+    parser.add_argument("--mapset-column", default="beatmapset_id", help="column holding the mapset id (default: %(default)s)")
+    parser.add_argument("--beatmap-column", default="beatmap_id", help="column holding the beatmap id, used with --beatmap-map (default: %(default)s)")
+    parser.add_argument("--beatmap-map", help="dump of beatmaps to map beatmap ids to mapset ids, for score or playcount dumps that only have beatmap ids")
+    parser.add_argument("--map-beatmap-column", default="beatmap_id", help="beatmap id column in --beatmap-map (default: %(default)s)")
+    parser.add_argument("--map-mapset-column", default="beatmapset_id", help="mapset id column in --beatmap-map (default: %(default)s)")
+    parser.add_argument("--chunk-size", type=int, default=100_000, help="rows per transaction (default: %(default)s)")
+    bulk_import(parser.parse_args(argv))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -3,25 +3,45 @@ from config import config
 from discord.ext import commands
 from discord import Option, Interaction, ApplicationContext, Embed, Message, File
 from discord.commands import slash_command
-from utilities import get_osu_user, get_osu_api
-import random
+from utilities import get_osu_user
+from prefetch import RoundPrefetcher
+from sampling import Sampler
+from edit_scheduler import edit_scheduler, MessageEditor
+from timers import timer_service, Timer
+from scoring import Scoreboard, get_speed_points
+from leaderboard import Leaderboard, EMBED_DESCRIPTION_LIMIT, get_length
+from osu_metadata import osu_metadata, format_beatmapset
 import asyncio
+import numpy as np
 import time
-from typing import Dict, List, Set, Tuple, Optional
-from . import game_db, BgGameDatabase, get_image_grid, get_preview
+from dataclasses import dataclass
+from io import BytesIO
+from typing import Dict, Hashable, List, Set, Optional
+from . import game_db, BgGameDatabase, get_image_grid, get_preview, MissingAssetError, asset_fetcher, asset_validator, render_executor, play_history_ingestor, played_set_index, phash_index
+from .bg_game_utilities import get_tile
 
 class MyCog(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot: commands.Bot = bot
 
+    @commands.Cog.listener()
+    async def on_ready(self):
+        await play_history_ingestor.resume()
+        await phash_index.load()
+
+    def cog_unload(self):
+        asyncio.create_task(asset_fetcher.close())
+        render_executor.shutdown()
+
     @slash_command(guild_ids=config.get_servers(cog_name='osu_bg_guess'), name="bg_game")
     async def bg_game(self, ctx: ApplicationContext):
         view = SignUpView(self, ctx.author.id)
         await view.update_embed(ctx)
 
 class RegisterModal(discord.ui.Modal):
-    def __init__(self, *args, **kwargs) -> None:
+    def __init__(self, *args, sign_up_view: Optional['SignUpView'] = None, **kwargs) -> None:
         super().__init__(*args, **kwargs)
+        self.sign_up_view: Optional[SignUpView] = sign_up_view
         self.add_item(discord.ui.InputText(label="Input"))
 
     async def callback(self, interaction: Interaction):
@@ -33,77 +53,126 @@ class RegisterModal(discord.ui.Modal):
             await interaction.response.send_message(f"User not found {user_input} Try again with just the ID", ephemeral=True)
             return
         
-        game_db.add_user(interaction.user.id, user.id)
+        await game_db.add_user(interaction.user.id, user.id)
         
-        await interaction.response.send_message(f"User found: {user.username} ({user.id}) registered\nhttps://osu.ppy.sh/users/{user.id}\nIf this is a mistake register with another name", ephemeral=True)
+        await interaction.response.send_message(f"User found: {user.username} ({user.id}) registered\nhttps://osu.ppy.sh/users/{user.id}\nIf this is a mistake register with another name\nYour play history is being imported, the sign up list shows the progress", ephemeral=True)
         await self.add_user_maps(user)
+        
+        if self.sign_up_view:
+            await self.sign_up_view.on_registered(interaction.user.id, user.id)
 
     async def add_user_maps(self, user):
-        api = get_osu_api()
-        user_beatmaps: List = []
-        
         print(f"Adding maps for {user.username}")
-        
-        for i in range(0, (user.beatmap_playcounts_count) // 100):
-            user_beatmaps += await api.user_beatmaps(user.id, limit=100, type="most_played", offset=i*100)
-            
-        map_ids: List[Tuple[int, int]] = [(beatmap.beatmap_id, beatmap.beatmapset.id) for beatmap in user_beatmaps]
-
-        game_db.add_play_history_batch([(user.id, beatmap.beatmapset.id) for beatmap in user_beatmaps])
-        
-        print(f"Added {len(map_ids)} maps to the database")
+        await play_history_ingestor.submit(user.id, user.beatmap_playcounts_count)
 
 class SignUpView(discord.ui.View):
     def __init__(self, cog: MyCog, host_id: Optional[int] = None):
         super().__init__()
         self.cog: MyCog = cog
         self.message: Optional[Message] = None
+        self.editor: Optional[MessageEditor] = None
         self.host: Optional[int] = host_id
         self.players: Dict[int, bool] = {host_id: True} if host_id else {}
+        self.osu_ids: Dict[int, int] = {}
+        self.popularity_weighting: bool = False
+        self.tasks: Set[asyncio.Task] = set()
+        play_history_ingestor.listeners.add(self.on_import_progress)
+    
+    def get_player_status(self, player: int) -> str:
+        progress: Optional[float] = play_history_ingestor.get_progress(self.osu_ids[player]) if player in self.osu_ids else None
+        if progress is not None:
+            return f"⏳ importing plays {progress:.0%}"
+        return '✅' if self.players[player] else '❌'
     
     def get_embed(self) -> Embed:
-        display: str = "\n".join([f"<@{player}>: {'✅' if self.players[player] else '❌'}" for player in self.players])
+        display: str = "\n".join([f"<@{player}>: {self.get_player_status(player)}" for player in self.players])
         embed = Embed(title="Sign up for the game", description=display)
         return embed
 
+    def on_import_progress(self, osu_id: int) -> None:
+        # Called as each page of a player's import lands, the editor merges bursts of these into one edit
+        if self.editor and osu_id in self.osu_ids.values():
+            task: asyncio.Task = asyncio.create_task(self.refresh_embed())
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def refresh_embed(self):
+        try:
+            await self.editor.edit(embed=self.get_embed(), view=self)
+        except discord.HTTPException as e:
+            print(f"Failed to update the sign up list: {e}")
+
+    async def on_timeout(self):
+        play_history_ingestor.listeners.discard(self.on_import_progress)
+
+    async def on_registered(self, discord_id: int, osu_id: int):
+        self.osu_ids[discord_id] = osu_id
+        if discord_id in self.players:
+            self.players[discord_id] = True
+            if self.editor:
+                await self.editor.edit(embed=self.get_embed(), view=self)
+
     async def update_embed(self, ctx: ApplicationContext):
         embed: Embed = self.get_embed()
-        if self.message:
-            await self.message.edit(embed=embed, view=self)
+        if self.editor:
+            # Joins arriving together go out as one edit
             await ctx.response.defer()
+            await self.editor.edit(embed=embed, view=self)
         elif ctx:
             await ctx.response.send_message(embed=embed, view=self)
             self.message = ctx.message
+            if self.message:
+                self.editor = edit_scheduler.get_editor(self.message)
     
     @discord.ui.button(label="Join", style=discord.ButtonStyle.green, custom_id="join_button")
     async def join_button_callback(self, button: discord.ui.Button, interaction: Interaction):
         if interaction.user.id in self.players:
             await interaction.response.send_message("You are already signed up", ephemeral=True)
         else:
-            db_user = game_db.get_user(interaction.user.id)
+            db_user = await game_db.get_user(interaction.user.id)
             
             self.players[interaction.user.id] = db_user is not None
+            if db_user is not None:
+                self.osu_ids[interaction.user.id] = db_user[2]
             await self.update_embed(interaction)
     
     @discord.ui.button(label="Register", style=discord.ButtonStyle.primary)
     async def register_button_callback(self, button: discord.ui.Button, interaction: Interaction):
-        modal = RegisterModal(title="Enter your osu username or user id")
+        modal = RegisterModal(title="Enter your osu username or user id", sign_up_view=self)
         await interaction.response.send_modal(modal)
         
+    @discord.ui.button(label="Favour popular maps: Off", style=discord.ButtonStyle.secondary)
+    async def weighting_button_callback(self, button: discord.ui.Button, interaction: Interaction):
+        if interaction.user.id != self.host:
+            await interaction.response.send_message("You are not the host", ephemeral=True)
+        else:
+            self.popularity_weighting = not self.popularity_weighting
+            button.label = f"Favour popular maps: {'On' if self.popularity_weighting else 'Off'}"
+            await self.update_embed(interaction)
+        
     @discord.ui.button(label="Start", style=discord.ButtonStyle.primary)
     async def start_button_callback(self, button: discord.ui.Button, interaction: Interaction):
         if interaction.user.id != self.host:
             await interaction.response.send_message("You are not the host", ephemeral=True)
         else:
+            await interaction.response.defer()
+            play_history_ingestor.listeners.discard(self.on_import_progress)
             
             #common_sets: List[int] = game_db.get_all_sets()
-            osu_ids: List[int] = game_db.get_osu_ids_from_discord(list(self.players.keys()))
-            common_sets: List[int] = game_db.get_common_sets(osu_ids)
-            print(f"Starting game with {len(common_sets)} mapsets")
+            osu_ids: List[int] = await game_db.get_osu_ids_from_discord(list(self.players.keys()))
+            common_sets: List[int] = await played_set_index.get_common_sets(osu_ids)
+            
+            playable_sets: List[int] = await asset_validator.get_playable(common_sets, needed=6 * MAX_ROUNDS)
+            print(f"Starting game with {len(playable_sets)} of {len(common_sets)} mapsets")
+            
+            # Popular sets come up more often when weighting is on, otherwise every set is equally likely
+            weights: Optional[List[int]] = await game_db.get_mapset_popularity(playable_sets) if self.popularity_weighting else None
             
-            game_view = GameView(set(self.players.keys()), common_sets, self.message)
+            game_view = GameView(set(self.players.keys()), Sampler(playable_sets, weights), self.message)
             await game_view.next_round()
 
+MAX_ROUNDS: int = 10
+
 num_emojis: Dict[int, str] = {-1: "🤷‍♂️", 0: "0️⃣", 1: "1️⃣", 2: "2️⃣", 3: "3️⃣", 4: "4️⃣", 5: "5️⃣", 6: "6️⃣", 7: "7️⃣", 8: "8️⃣", 9: "9️⃣"}
 
 def get_future_time(seconds: int) -> str:
@@ -112,23 +181,39 @@ def get_future_time(seconds: int) -> str:
     discord_timestamp: str = f"<t:{future_time}:R>"
     return discord_timestamp
 
+@dataclass
+class PreparedRound:
+    real_set_id: int
+    real_index: int
+    image: BytesIO
+    image_name: str
+    preview: BytesIO
+
 class GameView(discord.ui.View):
-    def __init__(self, players: Set[int], mapsets: List[int], message: Message):
+    def __init__(self, players: Set[int], mapsets: Sampler[int], message: Message):
         super().__init__()
         self.players: Set[int] = players
-        self.mapsets: List[int] = mapsets
+        self.mapsets: Sampler[int] = mapsets
         self.message: Message = message
+        self.editor: MessageEditor = edit_scheduler.get_editor(message)
         self.round: int = 0
-        self.max_rounds: int = 10
+        self.max_rounds: int = MAX_ROUNDS
         self.state: str = "getting_next_map"
         self.real_index: int = 0
-        self.player_guesses: Dict[int, int] = {}
-        self.player_guess_times: Dict[int, float] = {}
-        self.player_points: Dict[int, float] = {player_id: 0 for player_id in players}
+        self.real_set_id: Optional[int] = None
+        self.scores: Scoreboard = Scoreboard(players)
         self.create_buttons()
         self.round_start: float = time.time()
         self.guess_time: int = 30
         self.time_bonus: float = 0.25
+        self.rounds_prepared: int = 0
+        self.prefetcher: RoundPrefetcher[PreparedRound] = RoundPrefetcher(self.prepare_round, depth=2)
+        self.timer: Optional[Timer] = None
+        self.page: int = 0
+        self.show_guesses: bool = False
+        self.max_points: float = 0
+        self.deadline: str = ""
+        self.leaderboard: Leaderboard = Leaderboard(self.get_line_state, self.format_line, page_size=20, limit=EMBED_DESCRIPTION_LIMIT)
 
     async def button_callback(self, interaction: Interaction):
         await interaction.response.defer()
@@ -136,119 +221,231 @@ class GameView(discord.ui.View):
         await self.player_guess(interaction.user.id, guess)
             
     def create_buttons(self):
+        self.guess_buttons: List[discord.ui.Button] = []
         for i in range(6):
             button = discord.ui.Button(label=str(i + 1), style=discord.ButtonStyle.primary, row=i // 3, custom_id=str(i))
             button.callback = self.button_callback
             self.add_item(button)
+            self.guess_buttons.append(button)
+        
+        for label, custom_id in (("◀", "previous_page"), ("▶", "next_page")):
+            button = discord.ui.Button(label=label, style=discord.ButtonStyle.secondary, row=2, custom_id=custom_id)
+            button.callback = self.page_callback
+            self.add_item(button)
+        
+        button = discord.ui.Button(label="📍 My Position", style=discord.ButtonStyle.secondary, row=2, custom_id="position")
+        button.callback = self.position_callback
+        self.add_item(button)
+    
+    async def page_callback(self, interaction: Interaction):
+        await interaction.response.defer()
+        step: int = -1 if interaction.data['custom_id'] == "previous_page" else 1
+        self.page = (self.page + step) % self.leaderboard.page_count
+        await self.editor.edit(embed=self.get_embed(show_guesses=self.state == "showing_answers", add_time=self.state == "player_guesses"))
+    
+    async def position_callback(self, interaction: Interaction):
+        slot: Optional[int] = self.scores.slots.get(interaction.user.id)
+        embed: Embed = Embed(title="Your Position", description=self.leaderboard.render_context(slot) or "No players")
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+    
+    # Leaderboard lines are keyed by scoreboard slot and only formatted again when what they show changes
+    def get_line_state(self, slot: int) -> Hashable:
+        points: float = self.scores.arrays["totals"][slot].item()
+        if not self.show_guesses:
+            return points
+        guess: Optional[int] = self.scores.get_guess(slot)
+        crowned: bool = self.round >= self.max_rounds and points == self.max_points
+        return points, guess, self.scores.arrays["deltas"][slot].item(), crowned
+    
+    def format_line(self, slot: int, state: Hashable) -> str:
+        player: int = self.scores.ids[slot]
+        if not self.show_guesses:
+            return f"<@{player}>: {state:.2f}"
+        points, guess, bonus, crowned = state
+        guess = -2 if guess is None else guess
+        line: str = f"<@{player}>: {points:.2f} {num_emojis[guess+1]} {f'👍 +{bonus}' if guess == self.real_index else ''}"
+        if self.round >= self.max_rounds:
+            line += f" {'👑' if crowned else ''}"
+        return line
     
     def get_embed(self, show_guesses: bool = False, add_time: bool = False) -> Embed:
-        if show_guesses:
-            if self.round >= self.max_rounds:
-                max_points: float = max(self.player_points.values())
-                display: str = "\n".join([f"<@{player}>: {points:.2f} {num_emojis[self.player_guesses.get(player, -2)+1]} {f'👍 +{round(1 + (self.guess_time - round(self.player_guess_times[player] - self.round_start,3))*self.time_bonus/self.guess_time, 2)}' if self.player_guesses.get(player, -1) == self.real_index else ''} {'👑' if points == max_points else ''}" for player, points in self.player_points.items()])
-            else:
-                display: str = "\n".join([f"<@{player}>: {points:.2f} {num_emojis[self.player_guesses.get(player, -2)+1]} {f'👍 +{round(1 + (self.guess_time - round(self.player_guess_times[player] - self.round_start,3))*self.time_bonus/self.guess_time, 2)}' if self.player_guesses.get(player, -1) == self.real_index else ''}" for player, points in self.player_points.items()])
-        else:
-            display: str = "\n".join([f"<@{player}>: {points:.2f}" for player, points in self.player_points.items()])
-            
-        title: str = "Game Over" if self.round >= self.max_rounds else f"Round {self.round}/{self.max_rounds}" if self.state == "getting_next_map" else "Showing Answers"
+        self.show_guesses = show_guesses
+        self.max_points = self.scores.totals.max(initial=0)
+        self.leaderboard.set_order(self.scores.get_ranking().tolist())
+        self.page = min(self.page, self.leaderboard.page_count - 1)
         
+        header: str = ""
         if add_time:
-            display = f"Guessing ends {get_future_time(self.guess_time)}\n" + display
+            # Kept from when the round started, so turning pages doesn't move the deadline
+            header += f"Guessing ends {self.deadline}\n"
+        if show_guesses and self.real_set_id is not None:
+            answer: Optional[str] = format_beatmapset(self.real_set_id)
+            header += f"Answer: {f'{answer} · ' if answer else ''}[Beatmapset](https://osu.ppy.sh/beatmapsets/{self.real_set_id})\n"
+        if self.leaderboard.page_count > 1:
+            header += f"Page {self.page + 1}/{self.leaderboard.page_count}\n"
+        display: str = header + self.leaderboard.render_page(self.page, limit=EMBED_DESCRIPTION_LIMIT - get_length(header))
             
+        # Pages can be turned in any state, so the title follows the state rather than how the embed was asked for
+        if self.round >= self.max_rounds:
+            title: str = "Game Over"
+        elif self.state == "showing_answers":
+            title = "Showing Answers"
+        else:
+            title = f"Round {self.round}/{self.max_rounds}"
+        
         embed: Embed = Embed(title=title, description=display)
         return embed
     
-    async def next_round(self, update: bool = True):
-        if update:
-            self.player_guesses = {}
-            self.message.attachments.clear()
-            await self.message.edit(embed=self.get_embed())
+    async def pick_round_sets(self) -> Optional[List[int]]:
+        # Six sets with downloadable backgrounds that don't look alike, their tiles end up cached for the grid
+        chosen: List[int] = []
+        rejected: List[int] = []
+        while len(chosen) < 6:
+            needed: int = 6 - len(chosen)
+            if len(self.mapsets) < needed:
+                self.mapsets.put_back(chosen + rejected)
+                return None
             
-        round_sets: List[int] = random.sample(self.mapsets, 6)
+            candidates: List[int] = self.mapsets.sample(needed)
+            tiles = await asyncio.gather(*(get_tile(set_id) for set_id in candidates), return_exceptions=True)
+            for set_id, tile in zip(candidates, tiles):
+                if isinstance(tile, MissingAssetError):
+                    await asset_validator.mark_invalid(set_id, bg=True)
+                elif isinstance(tile, Exception) or phash_index.is_duplicate(set_id, chosen):
+                    rejected.append(set_id)
+                else:
+                    chosen.append(set_id)
         
-        for set_id in round_sets:
-            self.mapsets.remove(set_id)
+        # Duplicates only clash with this round, later rounds can still use them
+        self.mapsets.put_back(rejected)
+        return chosen
+    
+    async def prepare_round(self) -> Optional[PreparedRound]:
+        # Grids that fail for reasons unrelated to the sets put them all back, so this stops a broken renderer looping forever
+        render_failures: int = 0
+        while self.rounds_prepared < self.max_rounds and len(self.mapsets) >= 6 and render_failures < 3:
+            round_sets: Optional[List[int]] = await self.pick_round_sets()
+            if round_sets is None:
+                break
+            
+            real: int = round_sets.pop(0)
+            grid_result, preview_result = await asyncio.gather(
+                get_image_grid(round_sets, real),
+                get_preview(real),
+                return_exceptions=True
+            )
+            
+            if isinstance(grid_result, Exception):
+                print(f'failed to get image grid Retrying... ({grid_result})')
+                if isinstance(grid_result, MissingAssetError):
+                    await asset_validator.mark_invalid(grid_result.set_id, bg=True)
+                    # Only the broken set is dropped, the others can still be drawn later
+                    self.mapsets.put_back([set_id for set_id in round_sets + [real] if set_id != grid_result.set_id])
+                else:
+                    self.mapsets.put_back(round_sets + [real])
+                    render_failures += 1
+                continue
+            
+            img_grid, real_index, img_name = grid_result
+            
+            if isinstance(preview_result, Exception) or not preview_result[1]:
+                print(f"Invalid mp3 retrying... ({preview_result if isinstance(preview_result, Exception) else 'too short'})")
+                # A preview that couldn't be downloaded right now may still be fine
+                if not isinstance(preview_result, Exception):
+                    await asset_validator.mark_invalid(real, preview=True)
+                self.mapsets.put_back(round_sets)
+                continue
+            
+            self.rounds_prepared += 1
+            # The answer's title for the results, beatmapsets are looked up one at a time so only the real one is
+            osu_metadata.warm(beatmapset_ids=[real])
+            return PreparedRound(real_set_id=real, real_index=real_index, image=img_grid, image_name=img_name, preview=preview_result[0])
         
-        real: int = round_sets.pop(0)
-        try:
-            img_grid_path, real_index = get_image_grid(round_sets, real, "cogs\osu_bg_guess")
-        except Exception as e:
-            print('failed to get image grid Retrying...')
-            await self.next_round(update=False)
-            return
+        return None
+    
+    async def next_round(self):
+        self.scores.reset_guesses()
+        self.message.attachments.clear()
+        await self.editor.edit(embed=self.get_embed())
         
-        mp3, is_valid = get_preview(real, "cogs\osu_bg_guess")
+        # Usually ready already, it was prepared while the previous round was being guessed
+        prepared: Optional[PreparedRound] = await self.prefetcher.get()
         
-        if not is_valid:
-            print("Invalid mp3 retrying...")
-            await self.next_round(update=False)
+        if prepared is None:
+            print("Ran out of mapsets, ending game")
+            await self.end_game()
             return
         
-        self.real_index = real_index
+        self.real_index = prepared.real_index
+        self.real_set_id = prepared.real_set_id
         
-        self.image: File = discord.File(fp=img_grid_path, filename="bg_grid.png")
-        self.preview: File = discord.File(fp="cogs\osu_bg_guess\preview.mp3", filename="REMEMBER_TO_turn_down_volume.mp3")
+        self.image: File = discord.File(fp=prepared.image, filename=prepared.image_name)
+        self.preview: File = discord.File(fp=prepared.preview, filename="REMEMBER_TO_turn_down_volume.mp3")
         
-        for b in self.children:
+        for b in self.guess_buttons:
             b.disabled = False
             b.style = discord.ButtonStyle.primary
         
         self.message.attachments.clear()
+        self.deadline = get_future_time(self.guess_time)
         upload_start: float = time.time()
-        await self.message.edit(files=[self.image, self.preview], view=self, embed=self.get_embed(add_time=True))
+        await self.editor.edit(files=[self.image, self.preview], view=self, embed=self.get_embed(add_time=True))
         upload_end: float = time.time()
         
         self.state = "player_guesses"
-        round: int = self.round
         r_time: float = (self.guess_time - (upload_end - upload_start)) + self.time_bonus
         self.round_start = time.time()
-        await asyncio.sleep(r_time)
-        if self.round == round:
-            self.state = "showing_answers"
-            await self.show_answers()
+        self.timer = timer_service.schedule(r_time, self.show_answers)
     
     async def player_guess(self, player_id: int, guess: int):
-        if player_id not in self.players:
-            self.players.add(player_id)
+        if self.state != "player_guesses":
+            return
         
-        self.player_guesses[player_id] = guess
-        self.player_guess_times[player_id] = time.time()
+        # Players who didn't sign up join the scoreboard with their first guess
+        self.scores.guess(player_id, guess)
         
-        if len(self.player_guesses) == len(self.players):
-            self.state = "showing_answers"
+        if self.scores.guessed_count == len(self.scores):
             await self.show_answers()
         
         return
             
     async def show_answers(self):
+        # Reached from the round timer or from the last guess, whichever comes first
+        if self.state != "player_guesses":
+            return
+        self.state = "showing_answers"
+        if self.timer:
+            self.timer.cancel()
+        
         self.round += 1
-        for player, guess in self.player_guesses.items():
-            if player not in self.player_points:
-                self.player_points[player] = 0
-            
-            if guess == self.real_index:
-                if player in self.player_points:
-                    self.player_points[player] += round(1 + (self.guess_time - round(self.player_guess_times[player] - self.round_start,3))*self.time_bonus/self.guess_time, 2)
+        correct: np.ndarray = self.scores.guessed & (self.scores.guesses == self.real_index)
+        self.scores.apply(get_speed_points(self.scores.guess_times, self.round_start, self.guess_time, self.time_bonus), correct)
         
-        for b in self.children:
+        for b in self.guess_buttons:
             if b.label == str(self.real_index + 1):
                 b.style = discord.ButtonStyle.success
             else:
                 b.style = discord.ButtonStyle.danger
             b.disabled = True
         
-        await self.message.edit(embed=self.get_embed(show_guesses=True), view=self)
-        
-        await asyncio.sleep(4)
+        await self.editor.edit(embed=self.get_embed(show_guesses=True), view=self)
         
+        self.timer = timer_service.schedule(4, self.advance)
+    
+    async def advance(self):
+        self.state = "getting_next_map"
         if self.round < self.max_rounds:
             await self.next_round()
         else:
             await self.end_game()
     
-    def end_game(self):
-        self.message.edit(embed=self.get_embed(), view=None)
+    async def end_game(self):
+        if self.timer:
+            self.timer.cancel()
+        self.prefetcher.stop()
+        self.prefetcher.drain()
+        
+        await self.editor.edit(embed=self.get_embed(), view=None)
 
 def setup(bot: commands.Bot):
     bot.add_cog(MyCog(bot))
\ No newline at end of file
@@ -1,88 +1,314 @@
 import sqlite3
-from typing import List, Tuple, Optional
+import asyncio
+import threading
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Set, Tuple, Optional
+
+# Tuned for a large play_history table: WAL so reads never wait on the writer, a big page cache and memory mapped reads
+PRAGMAS: List[str] = [
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-65536",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA busy_timeout=5000",
+]
+
+DEFAULT_PATH: str = 'cogs/osu_bg_guess/bg_game.db'
+
+
+def create_schema(c: sqlite3.Cursor) -> None:
+    c.execute('''CREATE TABLE IF NOT EXISTS users
+                    (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    discord_id INTEGER UNIQUE,
+                    osu_id INTEGER)''')
+    
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_users_osu_id ON users(osu_id)''')
+    
+    c.execute('''CREATE TABLE IF NOT EXISTS play_history
+                (osu_id INTEGER,
+                mapset_id INTEGER,
+                PRIMARY KEY (osu_id, mapset_id))''')
+    
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_play_history_mapset_id ON play_history(mapset_id)''')
+    
+    c.execute('''CREATE TABLE IF NOT EXISTS mapset_assets
+                (mapset_id INTEGER PRIMARY KEY,
+                has_bg INTEGER,
+                preview_valid INTEGER,
+                bg_size INTEGER,
+                preview_size INTEGER,
+                last_checked REAL)''')
+    
+    c.execute('''CREATE TABLE IF NOT EXISTS mapset_phash
+                (mapset_id INTEGER PRIMARY KEY,
+                phash INTEGER)''')
+    
+    c.execute('''CREATE TABLE IF NOT EXISTS ingest_jobs
+                (osu_id INTEGER PRIMARY KEY,
+                total_pages INTEGER,
+                started REAL,
+                finished REAL)''')
+    
+    c.execute('''CREATE TABLE IF NOT EXISTS ingest_pages
+                (osu_id INTEGER,
+                page INTEGER,
+                PRIMARY KEY (osu_id, page))''')
+
 
 class BgGameDatabase:
     _instance: Optional['BgGameDatabase'] = None
-    def __init__(self) -> None:
-        self.conn: sqlite3.Connection = sqlite3.connect('cogs/osu_bg_guess/bg_game.db')
-        self.c: sqlite3.Cursor = self.conn.cursor()
-        
-        self.c.execute('''CREATE TABLE IF NOT EXISTS users
-                        (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        discord_id INTEGER UNIQUE,
-                        osu_id INTEGER)''')
+    def __init__(self, path: str = DEFAULT_PATH, read_workers: int = 4, max_write_batch: int = 256) -> None:
+        self.path: str = path
+        self.max_write_batch: int = max_write_batch
+        self.local: threading.local = threading.local()
+        self.readers: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=read_workers, thread_name_prefix="bg_game_db_read")
+        self.writes: queue.Queue = queue.Queue()
+        # Called with every committed play_history batch, used to keep in-memory indexes current
+        self.play_history_listeners: List[Callable[[List[Tuple[int, int]]], None]] = []
         
-        self.c.execute('''CREATE INDEX IF NOT EXISTS idx_users_osu_id ON users(osu_id)''')
+        self.writer: Optional[threading.Thread] = None
+        self.open_lock: threading.Lock = threading.Lock()
+    
+    def open(self) -> None:
+        # The schema and writer thread are set up on first use, so importing the package (e.g. for the bulk importer) touches nothing
+        if self.writer is not None:
+            return
+        with self.open_lock:
+            if self.writer is not None:
+                return
+            conn: sqlite3.Connection = self.connect()
+            create_schema(conn.cursor())
+            conn.close()
+            
+            writer: threading.Thread = threading.Thread(target=self.run_writer, name="bg_game_db_write", daemon=True)
+            writer.start()
+            self.writer = writer
+    
+    def connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, isolation_level=None)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+    
+    def get_reader(self) -> sqlite3.Connection:
+        # One connection per read thread, sqlite connections can't be shared between threads
+        conn: Optional[sqlite3.Connection] = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = self.local.conn = self.connect()
+        return conn
+    
+    async def read(self, fn: Callable[[sqlite3.Cursor], Any]) -> Any:
+        self.open()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.readers, lambda: fn(self.get_reader().cursor()))
+    
+    async def fetchall(self, query: str, params: Any = ()) -> List[Tuple]:
+        return await self.read(lambda c: c.execute(query, params).fetchall())
+    
+    async def fetchone(self, query: str, params: Any = ()) -> Optional[Tuple]:
+        return await self.read(lambda c: c.execute(query, params).fetchone())
+    
+    async def write(self, fn: Callable[[sqlite3.Cursor], Any]) -> Any:
+        self.open()
+        loop = asyncio.get_running_loop()
+        future: asyncio.Future = loop.create_future()
+        self.writes.put((fn, loop, future))
+        return await future
+    
+    def run_writer(self) -> None:
+        conn: sqlite3.Connection = self.connect()
+        c: sqlite3.Cursor = conn.cursor()
         
-        self.c.execute('''CREATE TABLE IF NOT EXISTS play_history
-                    (osu_id INTEGER,
-                    mapset_id INTEGER,
-                    PRIMARY KEY (osu_id, mapset_id))''')
+        while True:
+            batch: List[Tuple] = [self.writes.get()]
+            while len(batch) < self.max_write_batch:
+                try:
+                    batch.append(self.writes.get_nowait())
+                except queue.Empty:
+                    break
+            
+            closing: bool = None in batch
+            batch = [item for item in batch if item is not None]
+            results: List[Tuple[Any, Optional[BaseException]]] = []
+            
+            # Everything queued so far goes into one transaction, each write in its own savepoint so a failing one doesn't take the rest down
+            try:
+                c.execute("BEGIN IMMEDIATE")
+                for fn, _, _ in batch:
+                    c.execute("SAVEPOINT write")
+                    try:
+                        results.append((fn(c), None))
+                        c.execute("RELEASE write")
+                    except Exception as e:
+                        c.execute("ROLLBACK TO write")
+                        c.execute("RELEASE write")
+                        results.append((None, e))
+                c.execute("COMMIT")
+            except Exception as e:
+                if conn.in_transaction:
+                    conn.rollback()
+                results = [(None, e) for _ in batch]
+            
+            for (_, loop, future), (result, error) in zip(batch, results):
+                loop.call_soon_threadsafe(self.resolve, future, result, error)
+            
+            if closing:
+                conn.close()
+                return
+    
+    @staticmethod
+    def resolve(future: asyncio.Future, result: Any, error: Optional[BaseException]) -> None:
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+    
+    async def add_play_history_batch(self, play_data: List[Tuple[int, int]], checkpoint: Optional[Tuple[int, int]] = None) -> None:
+        def write(c: sqlite3.Cursor) -> None:
+            c.executemany("INSERT OR IGNORE INTO play_history (osu_id, mapset_id) VALUES (?, ?)", play_data)
+            if checkpoint:
+                # Committed together with the plays so a resumed import never skips a page
+                c.execute("INSERT OR IGNORE INTO ingest_pages (osu_id, page) VALUES (?, ?)", checkpoint)
+        await self.write(write)
         
-        self.conn.commit()
+        for listener in self.play_history_listeners:
+            listener(play_data)
+    
+    async def start_ingest_job(self, osu_id: int, total_pages: int, started: float) -> None:
+        def write(c: sqlite3.Cursor) -> None:
+            c.execute("DELETE FROM ingest_pages WHERE osu_id = ?", (osu_id,))
+            c.execute('''INSERT OR REPLACE INTO ingest_jobs (osu_id, total_pages, started, finished)
+                            VALUES (?, ?, ?, NULL)''', (osu_id, total_pages, started))
+        await self.write(write)
+    
+    async def finish_ingest_job(self, osu_id: int, finished: float) -> None:
+        def write(c: sqlite3.Cursor) -> None:
+            c.execute("UPDATE ingest_jobs SET finished = ? WHERE osu_id = ?", (finished, osu_id))
+            c.execute("DELETE FROM ingest_pages WHERE osu_id = ?", (osu_id,))
+        await self.write(write)
+    
+    async def get_ingest_job(self, osu_id: int) -> Optional[Tuple[int, int, float, Optional[float]]]:
+        return await self.fetchone("SELECT osu_id, total_pages, started, finished FROM ingest_jobs WHERE osu_id = ?", (osu_id,))
+    
+    async def get_unfinished_ingest_jobs(self) -> List[int]:
+        return [row[0] for row in await self.fetchall("SELECT osu_id FROM ingest_jobs WHERE finished IS NULL")]
     
-    def add_play_history_batch(self, play_data: List[Tuple[int, int]]) -> None:
-        self.c.executemany("INSERT OR IGNORE INTO play_history (osu_id, mapset_id) VALUES (?, ?)", play_data)
-        self.conn.commit()
+    async def get_ingested_pages(self, osu_id: int) -> Set[int]:
+        return {row[0] for row in await self.fetchall("SELECT page FROM ingest_pages WHERE osu_id = ?", (osu_id,))}
 
-    def get_common_sets(self, osu_ids: List[int]) -> List[int]:
-        placeholders = ','.join('?' for _ in osu_ids)
-        self.c.execute(f'''
-            SELECT DISTINCT osu_id 
-            FROM users 
-            WHERE osu_id IN ({placeholders})
-        ''', osu_ids)
-        
-        valid_osu_ids = [row[0] for row in self.c.fetchall()]
-        
-        if not valid_osu_ids:
-            return []
-        
-        placeholders = ','.join('?' for _ in valid_osu_ids)
+    async def get_common_sets(self, osu_ids: List[int]) -> List[int]:
+        def read(c: sqlite3.Cursor) -> List[int]:
+            placeholders = ','.join('?' for _ in osu_ids)
+            c.execute(f'''
+                SELECT DISTINCT osu_id 
+                FROM users 
+                WHERE osu_id IN ({placeholders})
+            ''', osu_ids)
+            
+            valid_osu_ids = [row[0] for row in c.fetchall()]
+            
+            if not valid_osu_ids:
+                return []
+            
+            placeholders = ','.join('?' for _ in valid_osu_ids)
 
-        if len(valid_osu_ids) == 1:
-            query = f'''
-            SELECT DISTINCT mapset_id
-            FROM play_history
-            WHERE osu_id = ?
-            '''
-            self.c.execute(query, valid_osu_ids)
-        else:
-            query = f'''
-            SELECT mapset_id
-            FROM play_history
-            WHERE osu_id IN ({placeholders})
-            GROUP BY mapset_id
-            HAVING COUNT(DISTINCT osu_id) = ?
-            '''
-            self.c.execute(query, valid_osu_ids + [len(valid_osu_ids)])
-        
-        return [row[0] for row in self.c.fetchall()]
+            if len(valid_osu_ids) == 1:
+                query = '''
+                SELECT DISTINCT mapset_id
+                FROM play_history
+                WHERE osu_id = ?
+                '''
+                c.execute(query, valid_osu_ids)
+            else:
+                query = f'''
+                SELECT mapset_id
+                FROM play_history
+                WHERE osu_id IN ({placeholders})
+                GROUP BY mapset_id
+                HAVING COUNT(DISTINCT osu_id) = ?
+                '''
+                c.execute(query, valid_osu_ids + [len(valid_osu_ids)])
+            
+            return [row[0] for row in c.fetchall()]
+        return await self.read(read)
 
-    def add_user(self, discord_id: int, osu_id: int) -> None:
-        self.c.execute('''INSERT OR REPLACE INTO users (discord_id, osu_id)
-                        VALUES (?, ?)''', (discord_id, osu_id))
-        self.conn.commit()
-    
-    def get_user(self, discord_id: int) -> Optional[Tuple[int, int, int]]:
-        self.c.execute("SELECT id, discord_id, osu_id FROM users WHERE discord_id = ?", (discord_id,))
-        return self.c.fetchone()
-    
-    def get_all_sets(self) -> List[int]:
-        self.c.execute("SELECT DISTINCT mapset_id FROM play_history")
-        return [row[0] for row in self.c.fetchall()]
+    async def add_mapset_assets_batch(self, asset_data: List[Tuple[int, bool, bool, int, int, float]]) -> None:
+        await self.write(lambda c: c.executemany('''INSERT OR REPLACE INTO mapset_assets (mapset_id, has_bg, preview_valid, bg_size, preview_size, last_checked)
+                        VALUES (?, ?, ?, ?, ?, ?)''', asset_data))
+    
+    async def mark_mapset_asset_missing(self, mapset_id: int, bg: bool = False, preview: bool = False) -> None:
+        # Only the missing asset is flagged, what the last check found for the other one and the sizes are kept.
+        # A set without a row gets one checked at 0, so the next check fills in the rest
+        def write(c: sqlite3.Cursor) -> None:
+            c.execute("INSERT OR IGNORE INTO mapset_assets (mapset_id, last_checked) VALUES (?, 0)", (mapset_id,))
+            if bg:
+                c.execute("UPDATE mapset_assets SET has_bg = 0 WHERE mapset_id = ?", (mapset_id,))
+            if preview:
+                c.execute("UPDATE mapset_assets SET preview_valid = 0 WHERE mapset_id = ?", (mapset_id,))
+        await self.write(write)
+    
+    async def get_valid_sets(self) -> Set[int]:
+        return {row[0] for row in await self.fetchall("SELECT mapset_id FROM mapset_assets WHERE has_bg = 1 AND preview_valid = 1")}
+    
+    async def get_checked_sets(self, checked_after: float) -> Set[int]:
+        return {row[0] for row in await self.fetchall("SELECT mapset_id FROM mapset_assets WHERE last_checked >= ?", (checked_after,))}
+
+    async def add_mapset_phash_batch(self, phash_data: List[Tuple[int, int]]) -> None:
+        # sqlite integers are signed, so the top bit of the hash is stored as the sign
+        rows = [(mapset_id, phash - (1 << 64) if phash >= 1 << 63 else phash) for mapset_id, phash in phash_data]
+        await self.write(lambda c: c.executemany("INSERT OR REPLACE INTO mapset_phash (mapset_id, phash) VALUES (?, ?)", rows))
+    
+    async def get_mapset_phashes(self) -> Dict[int, int]:
+        return {mapset_id: phash & ((1 << 64) - 1) for mapset_id, phash in await self.fetchall("SELECT mapset_id, phash FROM mapset_phash")}
+
+    async def add_user(self, discord_id: int, osu_id: int) -> None:
+        await self.write(lambda c: c.execute('''INSERT OR REPLACE INTO users (discord_id, osu_id)
+                        VALUES (?, ?)''', (discord_id, osu_id)))
+    
+    async def get_user(self, discord_id: int) -> Optional[Tuple[int, int, int]]:
+        return await self.fetchone("SELECT id, discord_id, osu_id FROM users WHERE discord_id = ?", (discord_id,))
+    
+    async def get_user_sets(self, osu_id: int) -> List[int]:
+        return [row[0] for row in await self.fetchall("SELECT mapset_id FROM play_history WHERE osu_id = ?", (osu_id,))]
+    
+    async def get_mapset_popularity(self, mapset_ids: List[int]) -> List[int]:
+        # Number of registered players who have played each set, in the same order as mapset_ids
+        def read(c: sqlite3.Cursor) -> List[int]:
+            counts: Dict[int, int] = {}
+            for i in range(0, len(mapset_ids), 900):
+                chunk = mapset_ids[i:i + 900]
+                placeholders = ','.join('?' for _ in chunk)
+                c.execute(f'''
+                    SELECT mapset_id, COUNT(*)
+                    FROM play_history
+                    WHERE mapset_id IN ({placeholders})
+                    GROUP BY mapset_id
+                ''', chunk)
+                counts.update(c.fetchall())
+            return [counts.get(mapset_id, 0) for mapset_id in mapset_ids]
+        return await self.read(read)
+    
+    async def get_all_sets(self) -> List[int]:
+        return [row[0] for row in await self.fetchall("SELECT DISTINCT mapset_id FROM play_history")]
 
-    def get_osu_ids_from_discord(self, discord_ids: List[int]) -> List[int]:
+    async def get_osu_ids_from_discord(self, discord_ids: List[int]) -> List[int]:
         placeholders = ','.join('?' for _ in discord_ids)
-        self.c.execute(f'''
+        rows = await self.fetchall(f'''
             SELECT osu_id
             FROM users
             WHERE discord_id IN ({placeholders})
         ''', discord_ids)
-        return [row[0] for row in self.c.fetchall()]
+        return [row[0] for row in rows]
 
     def close(self) -> None:
-        self.conn.close()
+        if self.writer is not None:
+            self.writes.put(None)
+            self.writer.join()
+        self.readers.shutdown()
         
     @classmethod
     def get_instance(cls) -> 'BgGameDatabase':
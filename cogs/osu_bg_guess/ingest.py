@@ -0,0 +1,115 @@
+import time
+import asyncio
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from utilities import get_osu_api
+from .db import game_db
+
+PAGE_SIZE: int = 100
+
+
+class PlayHistoryIngestor:
+    _instance: Optional['PlayHistoryIngestor'] = None
+
+    def __init__(self, page_concurrency: int = 4, job_concurrency: int = 2) -> None:
+        self.page_concurrency: int = page_concurrency
+        self.job_concurrency: int = job_concurrency
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.workers: List[asyncio.Task] = []
+        # osu_id -> (pages done, total pages) for every queued or running import
+        self.progress: Dict[int, Tuple[int, int]] = {}
+        # Called with an osu_id whenever its progress moves and once more when its import ends, however it ends
+        self.listeners: Set[Callable[[int], None]] = set()
+
+    def start(self) -> None:
+        self.workers = [worker for worker in self.workers if not worker.done()]
+        while len(self.workers) < self.job_concurrency:
+            self.workers.append(asyncio.create_task(self.run()))
+
+    async def submit(self, osu_id: int, playcount: int) -> None:
+        if osu_id in self.progress:
+            return
+        # Claimed before anything is awaited so a second submit can't start the same import
+        self.progress[osu_id] = (0, 0)
+        try:
+            job = await game_db.get_ingest_job(osu_id)
+            # An interrupted import picks up where it stopped, a finished one is redone to catch new plays
+            if job is None or job[3] is not None:
+                total_pages: int = -(-playcount // PAGE_SIZE)
+                await game_db.start_ingest_job(osu_id, total_pages, time.time())
+            await self.enqueue(osu_id)
+        except BaseException:
+            # Nothing was queued, the player has to be able to submit again
+            self.progress.pop(osu_id, None)
+            self.notify(osu_id)
+            raise
+
+    async def resume(self) -> None:
+        for osu_id in await game_db.get_unfinished_ingest_jobs():
+            if osu_id in self.progress:
+                continue
+            print(f"Resuming play history import for {osu_id}")
+            self.progress[osu_id] = (0, 0)
+            try:
+                await self.enqueue(osu_id)
+            except BaseException:
+                self.progress.pop(osu_id, None)
+                raise
+
+    async def enqueue(self, osu_id: int) -> None:
+        job = await game_db.get_ingest_job(osu_id)
+        self.progress[osu_id] = (len(await game_db.get_ingested_pages(osu_id)), job[1])
+        self.queue.put_nowait(osu_id)
+        self.start()
+        self.notify(osu_id)
+
+    def notify(self, osu_id: int) -> None:
+        for listener in list(self.listeners):
+            listener(osu_id)
+
+    async def run(self) -> None:
+        while True:
+            osu_id: int = await self.queue.get()
+            try:
+                await self.ingest(osu_id)
+            except Exception as e:
+                print(f"Play history import for {osu_id} failed, it will resume later: {e!r}")
+            finally:
+                self.progress.pop(osu_id, None)
+                self.notify(osu_id)
+
+    async def ingest(self, osu_id: int) -> None:
+        api = get_osu_api()
+        _, total_pages, started, _ = await game_db.get_ingest_job(osu_id)
+        done: Set[int] = await game_db.get_ingested_pages(osu_id)
+        semaphore = asyncio.Semaphore(self.page_concurrency)
+
+        async def ingest_page(page: int) -> None:
+            async with semaphore:
+                user_beatmaps = await api.user_beatmaps(osu_id, limit=PAGE_SIZE, type="most_played", offset=page * PAGE_SIZE)
+            await game_db.add_play_history_batch([(osu_id, beatmap.beatmapset.id) for beatmap in user_beatmaps], checkpoint=(osu_id, page))
+            pages_done, _ = self.progress[osu_id]
+            self.progress[osu_id] = (pages_done + 1, total_pages)
+            self.notify(osu_id)
+
+        results = await asyncio.gather(*(ingest_page(page) for page in range(total_pages) if page not in done), return_exceptions=True)
+        failures = [result for result in results if isinstance(result, Exception)]
+
+        if failures:
+            raise failures[0]
+
+        await game_db.finish_ingest_job(osu_id, time.time())
+        print(f"Imported {total_pages} pages of play history for {osu_id} in {time.time() - started:.1f}s")
+
+    def get_progress(self, osu_id: int) -> Optional[float]:
+        if osu_id not in self.progress:
+            return None
+        pages_done, total_pages = self.progress[osu_id]
+        return pages_done / total_pages if total_pages else 1.0
+
+    @classmethod
+    def get_instance(cls) -> 'PlayHistoryIngestor':
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+play_history_ingestor = PlayHistoryIngestor.get_instance()
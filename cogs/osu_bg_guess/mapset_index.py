@@ -0,0 +1,101 @@
+import asyncio
+import numpy as np
+from collections import OrderedDict
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+from .db import game_db
+
+
+def build_bitmap(mapset_ids: Iterable[int], size: int = 0) -> np.ndarray:
+    ids = np.fromiter(mapset_ids, dtype=np.int64)
+    words = np.zeros(max(size, int(ids.max()) // 64 + 1 if len(ids) else 0), dtype=np.uint64)
+    np.bitwise_or.at(words, ids >> 6, np.left_shift(np.uint64(1), (ids & 63).astype(np.uint64)))
+    return words
+
+def bitmap_to_ids(words: np.ndarray) -> np.ndarray:
+    return np.flatnonzero(np.unpackbits(words.astype('<u8').view(np.uint8), bitorder='little'))
+
+
+class PlayedSetIndex:
+    _instance: Optional['PlayedSetIndex'] = None
+
+    def __init__(self, max_cached_results: int = 64) -> None:
+        # osu_id -> one bit per mapset id the player has played
+        self.bitmaps: Dict[int, np.ndarray] = {}
+        self.versions: Dict[int, int] = {}
+        self.loading: Dict[int, asyncio.Task] = {}
+        self.pending: Dict[int, List[int]] = {}
+        self.results: OrderedDict[FrozenSet[int], Tuple[Tuple[int, ...], np.ndarray]] = OrderedDict()
+        self.max_cached_results: int = max_cached_results
+        game_db.play_history_listeners.append(self.add)
+
+    async def load(self, osu_id: int) -> np.ndarray:
+        # Plays written while the query runs are held back and applied once it returns
+        self.pending[osu_id] = []
+        try:
+            bitmap = build_bitmap(await game_db.get_user_sets(osu_id))
+            self.bitmaps[osu_id] = bitmap
+            self.apply(osu_id, self.pending[osu_id])
+        finally:
+            self.pending.pop(osu_id, None)
+            self.loading.pop(osu_id, None)
+        return self.bitmaps[osu_id]
+
+    async def get_bitmap(self, osu_id: int) -> np.ndarray:
+        if osu_id in self.bitmaps:
+            return self.bitmaps[osu_id]
+        if osu_id not in self.loading:
+            self.loading[osu_id] = asyncio.create_task(self.load(osu_id))
+        return await self.loading[osu_id]
+
+    def add(self, play_data: List[Tuple[int, int]]) -> None:
+        by_player: Dict[int, List[int]] = {}
+        for osu_id, mapset_id in play_data:
+            by_player.setdefault(osu_id, []).append(mapset_id)
+
+        for osu_id, mapset_ids in by_player.items():
+            if osu_id in self.pending:
+                self.pending[osu_id] += mapset_ids
+            elif osu_id in self.bitmaps:
+                self.apply(osu_id, mapset_ids)
+
+    def apply(self, osu_id: int, mapset_ids: List[int]) -> None:
+        if not mapset_ids:
+            return
+        bitmap = self.bitmaps[osu_id]
+        update = build_bitmap(mapset_ids, size=len(bitmap))
+        update[:len(bitmap)] |= bitmap
+        self.bitmaps[osu_id] = update
+        self.versions[osu_id] = self.versions.get(osu_id, 0) + 1
+
+    async def get_common_sets(self, osu_ids: List[int]) -> List[int]:
+        key: FrozenSet[int] = frozenset(osu_ids)
+        if not key:
+            return []
+
+        bitmaps: List[np.ndarray] = list(await asyncio.gather(*(self.get_bitmap(osu_id) for osu_id in key)))
+        versions: Tuple[int, ...] = tuple(self.versions.get(osu_id, 0) for osu_id in sorted(key))
+
+        cached = self.results.get(key)
+        if cached is not None and cached[0] == versions:
+            self.results.move_to_end(key)
+            return cached[1].tolist()
+
+        size: int = min(len(bitmap) for bitmap in bitmaps)
+        common: np.ndarray = bitmaps[0][:size].copy()
+        for bitmap in bitmaps[1:]:
+            np.bitwise_and(common, bitmap[:size], out=common)
+
+        mapset_ids: np.ndarray = bitmap_to_ids(common)
+        self.results[key] = (versions, mapset_ids)
+        if len(self.results) > self.max_cached_results:
+            self.results.popitem(last=False)
+
+        return mapset_ids.tolist()
+
+    @classmethod
+    def get_instance(cls) -> 'PlayedSetIndex':
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+played_set_index = PlayedSetIndex.get_instance()
@@ -0,0 +1,103 @@
+import asyncio
+from typing import Dict, List, Optional, Set, Tuple
+from grid_render import get_dhashes
+from .db import game_db
+from .tile_cache import tile_cache
+from .render import render_executor
+
+
+class PhashIndex:
+    _instance: Optional['PhashIndex'] = None
+
+    def __init__(self, max_distance: int = 3, backfill_batch: int = 256) -> None:
+        self.max_distance: int = max_distance
+        self.backfill_batch: int = backfill_batch
+        # Split into max_distance + 1 bands, two hashes within max_distance bits of each other always share a band exactly
+        bands: int = max_distance + 1
+        self.bands: List[Tuple[int, int]] = [(64 * i // bands, 64 * (i + 1) // bands) for i in range(bands)]
+        self.buckets: List[Dict[int, Set[int]]] = [{} for _ in self.bands]
+        self.hashes: Dict[int, int] = {}
+        self.loading: Optional[asyncio.Task] = None
+        self.backfill_task: Optional[asyncio.Task] = None
+
+    def get_keys(self, phash: int) -> List[int]:
+        return [(phash >> start) & ((1 << (end - start)) - 1) for start, end in self.bands]
+
+    def add(self, set_id: int, phash: int) -> None:
+        old: Optional[int] = self.hashes.get(set_id)
+        if old == phash:
+            return
+        if old is not None:
+            for bucket, key in zip(self.buckets, self.get_keys(old)):
+                bucket[key].discard(set_id)
+
+        self.hashes[set_id] = phash
+        for bucket, key in zip(self.buckets, self.get_keys(phash)):
+            bucket.setdefault(key, set()).add(set_id)
+
+    async def add_hashes(self, phashes: Dict[int, int]) -> None:
+        for set_id, phash in phashes.items():
+            self.add(set_id, phash)
+        await game_db.add_mapset_phash_batch(list(phashes.items()))
+
+    def get_near(self, set_id: int) -> Set[int]:
+        # Sets whose background is within max_distance bits of this one, not including itself
+        phash: Optional[int] = self.hashes.get(set_id)
+        if phash is None:
+            return set()
+
+        candidates: Set[int] = set()
+        for bucket, key in zip(self.buckets, self.get_keys(phash)):
+            candidates |= bucket.get(key, set())
+        return {other for other in candidates if other != set_id and (self.hashes[other] ^ phash).bit_count() <= self.max_distance}
+
+    def is_duplicate(self, set_id: int, chosen: List[int]) -> bool:
+        near: Set[int] = self.get_near(set_id)
+        return any(other in near for other in chosen)
+
+    async def load(self) -> None:
+        if self.loading is None:
+            self.loading = asyncio.create_task(self.run_load())
+        await self.loading
+
+    async def run_load(self) -> None:
+        for set_id, phash in (await game_db.get_mapset_phashes()).items():
+            self.add(set_id, phash)
+        print(f"Loaded {len(self.hashes)} background hashes")
+        if self.backfill_task is None or self.backfill_task.done():
+            self.backfill_task = asyncio.create_task(self.backfill())
+
+    async def backfill(self) -> None:
+        # Tiles cached before hashes existed get hashed in batches, straight from disk so the cache order is left alone
+        await tile_cache.load()
+        missing: List[int] = [set_id for set_id in list(tile_cache.entries) if set_id not in self.hashes]
+        for i in range(0, len(missing), self.backfill_batch):
+            batch: List[Tuple[int, bytes]] = await asyncio.to_thread(read_tiles, missing[i:i + self.backfill_batch])
+            try:
+                phashes: List[int] = await render_executor.run(get_dhashes, [tile for _, tile in batch])
+            except Exception as e:
+                print(f"Failed to hash cached tiles: {e!r}")
+                continue
+            await self.add_hashes({set_id: phash for (set_id, _), phash in zip(batch, phashes)})
+
+        if missing:
+            print(f"Hashed {len(missing)} cached backgrounds")
+
+    @classmethod
+    def get_instance(cls) -> 'PhashIndex':
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+
+def read_tiles(set_ids: List[int]) -> List[Tuple[int, bytes]]:
+    tiles: List[Tuple[int, bytes]] = []
+    for set_id in set_ids:
+        try:
+            with open(tile_cache.get_path(set_id), "rb") as f:
+                tiles.append((set_id, f.read()))
+        except OSError:
+            continue
+    return tiles
+
+phash_index = PhashIndex.get_instance()
@@ -0,0 +1,68 @@
+import os
+import time
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional
+
+
+class RenderExecutor:
+    _instance: Optional['RenderExecutor'] = None
+
+    def __init__(self, max_workers: Optional[int] = None) -> None:
+        self.max_workers: int = max_workers or os.cpu_count() or 1
+        self.pool: Optional[ProcessPoolExecutor] = None
+        self.pending: int = 0
+        self.jobs: int = 0
+        self.total_latency: float = 0
+        self.max_latency: float = 0
+
+    def get_pool(self) -> ProcessPoolExecutor:
+        # Created on first use so worker processes importing this module don't start pools of their own
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self.pool
+
+    async def run(self, fn: Callable, *args: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        self.pending += 1
+        start: float = time.perf_counter()
+        try:
+            return await loop.run_in_executor(self.get_pool(), fn, *args)
+        except BrokenProcessPool:
+            # A worker died, start a fresh pool for the next job
+            self.pool = None
+            raise
+        finally:
+            self.pending -= 1
+            latency: float = time.perf_counter() - start
+            self.jobs += 1
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+
+    @property
+    def queue_depth(self) -> int:
+        return max(0, self.pending - self.max_workers)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "workers": self.max_workers,
+            "pending": self.pending,
+            "queue_depth": self.queue_depth,
+            "jobs": self.jobs,
+            "avg_latency": self.total_latency / self.jobs if self.jobs else 0,
+            "max_latency": self.max_latency,
+        }
+
+    def shutdown(self) -> None:
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+
+    @classmethod
+    def get_instance(cls) -> 'RenderExecutor':
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+render_executor = RenderExecutor.get_instance()
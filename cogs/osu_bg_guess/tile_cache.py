@@ -0,0 +1,136 @@
+import os
+import asyncio
+import tempfile
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from config import config
+
+# Overridden by "bg_game_tile_cache_mb" in config.json's settings
+DEFAULT_MAX_MB: int = 512
+
+
+class TileCache:
+    _instance: Optional['TileCache'] = None
+
+    def __init__(self, cache_dir: str = 'cogs/osu_bg_guess/tile_cache', max_bytes: Optional[int] = None) -> None:
+        self.cache_dir: str = cache_dir
+        self.max_bytes: int = max_bytes if max_bytes is not None else int(config.get_setting("bg_game_tile_cache_mb", DEFAULT_MAX_MB) * 1024 * 1024)
+        # mapset id -> file size, least recently used first
+        self.entries: OrderedDict[int, int] = OrderedDict()
+        self.total_bytes: int = 0
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+        # The directory is only scanned on first use, so importing this touches no files
+        self.loaded: bool = False
+        self.load_lock: asyncio.Lock = asyncio.Lock()
+
+    def get_path(self, set_id: int) -> str:
+        return f"{self.cache_dir}/{set_id}.jpg"
+
+    def scan(self) -> List[Tuple[float, int, int]]:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        files = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".tmp"):
+                # Left behind by a write that never finished
+                os.remove(entry.path)
+            elif entry.name.endswith(".jpg") and entry.name[:-4].isdigit():
+                stat = entry.stat()
+                files.append((stat.st_mtime, int(entry.name[:-4]), stat.st_size))
+        return files
+
+    async def load(self) -> None:
+        async with self.load_lock:
+            if self.loaded:
+                return
+            files: List[Tuple[float, int, int]] = await asyncio.to_thread(self.scan)
+
+            # mtime is bumped on every hit, so it doubles as the persisted recency order
+            for _, set_id, size in sorted(files):
+                self.entries[set_id] = size
+                self.total_bytes += size
+            self.loaded = True
+
+        await self.evict()
+
+    def read(self, set_id: int) -> Optional[bytes]:
+        path = self.get_path(set_id)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            return None
+        return data
+
+    def write(self, set_id: int, data: bytes) -> bool:
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, self.get_path(set_id))
+        except OSError as e:
+            print(f"Failed to cache tile for mapset {set_id}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return False
+        return True
+
+    async def get(self, set_id: int) -> Optional[bytes]:
+        await self.load()
+        if set_id not in self.entries:
+            self.misses += 1
+            return None
+
+        data: Optional[bytes] = await asyncio.to_thread(self.read, set_id)
+        if data is None:
+            self.total_bytes -= self.entries.pop(set_id, 0)
+            self.misses += 1
+            return None
+
+        # May have been evicted while it was read
+        if set_id in self.entries:
+            self.entries.move_to_end(set_id)
+        self.hits += 1
+        return data
+
+    async def put(self, set_id: int, data: bytes) -> None:
+        await self.load()
+        if not await asyncio.to_thread(self.write, set_id, data):
+            return
+
+        self.total_bytes -= self.entries.pop(set_id, 0)
+        self.entries[set_id] = len(data)
+        self.total_bytes += len(data)
+        await self.evict()
+
+    async def evict(self) -> None:
+        # Entries are dropped right away so the budget holds, their files are removed off the event loop
+        paths: List[str] = []
+        while self.total_bytes > self.max_bytes and self.entries:
+            set_id, size = self.entries.popitem(last=False)
+            self.total_bytes -= size
+            self.evictions += 1
+            paths.append(self.get_path(set_id))
+        if paths:
+            await asyncio.to_thread(remove_files, paths)
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self.entries), "bytes": self.total_bytes, "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+    @classmethod
+    def get_instance(cls) -> 'TileCache':
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+
+def remove_files(paths: List[str]) -> None:
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+tile_cache = TileCache.get_instance()
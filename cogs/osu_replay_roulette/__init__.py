@@ -1 +1,5 @@
 from .utilities import get_future_time, simplify_number, number_from_string
+from .manifest import video_manifest, VideoManifest
+from .video_pool import video_pool, VideoPool
+from .rank_index import RankIndex, SelectionPolicy, SELECTION_POLICIES, any_clip, uniform_log_rank, widening_log_rank
+from .transcoder import clip_transcoder, ClipTranscoder
@@ -3,20 +3,32 @@ from config import config
 from discord.ext import commands
 from discord import Option, Embed, File, ButtonStyle, Interaction
 from discord.commands import slash_command
+from prefetch import RoundPrefetcher
+from edit_scheduler import edit_scheduler, MessageEditor
+from timers import timer_service, Timer
+from scoring import Scoreboard, get_rank_damage
+from leaderboard import Leaderboard, EMBED_DESCRIPTION_LIMIT
+from osu_metadata import osu_metadata, format_beatmap, format_user
 import time
 import asyncio
-import os
-import json
-import random
-import math
-from typing import Set, Dict, List, Optional, Any
+import numpy as np
+from io import BytesIO
+from dataclasses import dataclass
+from typing import Set, Dict, List, Optional, Any, Hashable
 from .utilities import get_future_time, simplify_number, number_from_string
+from .video_pool import video_pool
+from .rank_index import SelectionPolicy, uniform_log_rank
 
 
 class RRCog(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot: commands.Bot = bot
 
+    @commands.Cog.listener()
+    async def on_ready(self):
+        # Starts transcoding whatever is waiting before the first game needs it
+        await video_pool.load()
+
     @slash_command(guild_ids=config.get_servers(), name="replay_roulette")
     async def replay_roulette(self, ctx: discord.ApplicationContext) -> None:
         view: SignUpView = SignUpView(self, ctx.author.id)
@@ -28,6 +40,7 @@ class SignUpView(discord.ui.View):
         super().__init__()
         self.cog: RRCog = cog
         self.message: Optional[discord.Message] = None
+        self.editor: Optional[MessageEditor] = None
         self.host: Optional[int] = host_id
         self.players: Set[int] = set()
     
@@ -50,12 +63,14 @@ class SignUpView(discord.ui.View):
 
     async def update_embed(self, ctx: discord.ApplicationContext) -> None:
         embed: Embed = self.get_embed()
-        if self.message:
-            await self.message.edit(embed=embed, view=self)
+        if self.editor:
+            # Joins arriving together go out as one edit
             await ctx.response.defer()
+            await self.editor.edit(embed=embed, view=self)
         else:
             await ctx.response.send_message(embed=embed, view=self)
             self.message = await ctx.interaction.original_response()
+            self.editor = edit_scheduler.get_editor(self.message)
     
     @discord.ui.button(label="Join", style=ButtonStyle.green, custom_id="join_button")
     async def join_button_callback(self, button: discord.ui.Button, interaction: Interaction) -> None:
@@ -71,6 +86,7 @@ class SignUpView(discord.ui.View):
             await interaction.response.send_message("You are not the host", ephemeral=True)
         else:
             await interaction.response.edit_message(embed=self.get_embed(starting=True), view=None)
+            await video_pool.load()
             game_view: GameView = GameView(self.players, self.message)
             await game_view.next_round()
             
@@ -94,80 +110,168 @@ class SignUpView(discord.ui.View):
         await interaction.response.send_message(embed=embed, ephemeral=True)
 
 class Player:
-    def __init__(self, id: int, starting_hp: int):
+    # One slot of the registry's scoreboard
+    def __init__(self, id: int, slot: int, scores: Scoreboard):
         self.id: int = id
-        self.hp: int = starting_hp
-        self.guess: Optional[int] = None
+        self.slot: int = slot
+        self.scores: Scoreboard = scores
         self.eliminated_round: Optional[int] = None
 
-    def make_guess(self, guess: int) -> None:
-        self.guess = guess
+    @property
+    def hp(self) -> int:
+        return int(self.scores.totals[self.slot])
 
-    def get_damage(self, real_rank: int, round:int) -> int:
-        return int(abs(math.log(self.guess or 1, 2) - math.log(real_rank, 2)) * (1000 * math.sqrt(round)))
-    
-    def take_damage(self, damage: int) -> None:
-        self.hp -= damage
+    @property
+    def guess(self) -> Optional[int]:
+        return self.scores.get_guess(self.slot)
 
-    def eliminate(self, round: int) -> None:
-        self.eliminated_round = round
+    @property
+    def damage(self) -> int:
+        # Taken in the last round
+        return int(-self.scores.deltas[self.slot])
 
     def is_eliminated(self) -> bool:
         return self.hp <= 0
 
-    def reset_guess(self) -> None:
-        self.guess = None
 
+class PlayerRegistry:
+    # Players by discord id with running alive and guessed counts, so a guess and the everyone-guessed check are O(1).
+    # Guesses and HP live in a scoreboard so a round's damage is one vectorized call, the HP ranking is only re-sorted then
+    def __init__(self, player_ids: Set[int], starting_hp: int):
+        self.scores: Scoreboard = Scoreboard(player_ids, starting_total=starting_hp)
+        self.by_slot: List[Player] = [Player(player_id, slot, self.scores) for slot, player_id in enumerate(self.scores.ids)]
+        self.players: Dict[int, Player] = {player.id: player for player in self.by_slot}
+        self.ranking: List[Player] = list(self.by_slot)
+        self.alive_count: int = len(self.players)
+        self.lowest_damage: int = 0
+
+    def __len__(self) -> int:
+        return len(self.players)
+
+    def get(self, player_id: int) -> Optional[Player]:
+        return self.players.get(player_id)
+
+    def guess(self, player_id: int, guess: int) -> bool:
+        player: Optional[Player] = self.players.get(player_id)
+        if player is None or player.is_eliminated():
+            return False
+        self.scores.guess(player_id, guess)
+        return True
+
+    @property
+    def guessed_count(self) -> int:
+        return self.scores.guessed_count
+
+    @property
+    def all_guessed(self) -> bool:
+        return self.scores.guessed_count >= self.alive_count
+
+    def new_round(self) -> None:
+        self.scores.reset_guesses()
+
+    def apply_damage(self, real_rank: int, round: int) -> None:
+        alive: np.ndarray = self.scores.totals > 0
+        damage: np.ndarray = get_rank_damage(self.scores.get_guesses(default=1), real_rank, round)
+        self.scores.apply(-damage, alive)
+
+        still_alive: np.ndarray = self.scores.totals > 0
+        for slot in np.flatnonzero(alive & ~still_alive):
+            self.by_slot[slot].eliminated_round = round
+        self.alive_count = int(still_alive.sum())
+
+        self.ranking = [self.by_slot[slot] for slot in self.scores.get_ranking()]
+        self.lowest_damage = int(damage[still_alive].min()) if self.alive_count else 0
+
+
+@dataclass
+class PreparedClip:
+    info: Dict[str, Any]
+    data: bytes
+
+
+def get_label(text: Optional[str]) -> str:
+    return f"{text} · " if text else ""
+
+def read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
 
 
 class GameView(discord.ui.View):
-    def __init__(self, player_ids: Set[int], message: discord.Message):
+    def __init__(self, player_ids: Set[int], message: discord.Message, policy: SelectionPolicy = uniform_log_rank):
         super().__init__()
         self.message: discord.Message = message
+        self.editor: MessageEditor = edit_scheduler.get_editor(message)
         self.round: int = 1
         self.state: str = "getting_next_map"
         self.real_rank: int = 0
         self.starting_hp: int = 10_000
-        self.players: List[Player] = [Player(player_id, self.starting_hp) for player_id in player_ids]
+        self.players: PlayerRegistry = PlayerRegistry(player_ids, self.starting_hp)
         self.current_video: Optional[Dict[str, Any]] = None
         self.previous_video: Optional[Dict[str, Any]] = None
-        self.videos_info: List[Dict[str, Any]] = self.get_videos_info()
+        self.prefetcher: RoundPrefetcher[PreparedClip] = RoundPrefetcher(self.prepare_round, depth=1)
+        self.policy: SelectionPolicy = policy
+        self.rounds_prepared: int = 0
+        self.timer: Optional[Timer] = None
+        self.page: int = 0
+        self.show_results: bool = False
+        self.active_board: Leaderboard = Leaderboard(self.get_active_state, self.format_active_line)
+        self.eliminated_board: Leaderboard = Leaderboard(self.get_eliminated_state, self.format_eliminated_line)
     
     
-    @property
-    def alive_players(self) -> List[Player]:
-        return [player for player in self.players if not player.is_eliminated()]
-    
-    def get_videos_info(self) -> List[Dict[str, Any]]:
-        video_directory: str = "cogs/osu_replay_roulette/videos"
-        
-        video_files: List[str] = [video for video in os.listdir(video_directory) if video.endswith(".mp4")]
-        
-        video_info: List[Dict[str, Any]] = []
-        
-        for video in video_files:
-            rank: int = int(video.split("/")[-1].split(".mp4")[0])
-            json_metadata: str = f"{video_directory}/{video.split('.')[0]}.json"
-            with open(json_metadata, "r") as f:
-                metadata: Dict[str, Any] = json.load(f)
-                
-            video_info.append({
-                "path": f"{video_directory}/{video}",
-                "rank": rank,
-                "map_id": metadata["map_id"],
-                "mapset_id": metadata["mapset_id"],
-                "player_id": metadata["player_id"],
-                "score_id": metadata["score_id"]
-            })
-        random.shuffle(video_info)
-        
-        return video_info
-        
     @discord.ui.button(label="Guess", style=ButtonStyle.primary)
     async def register_button_callback(self, button: discord.ui.Button, interaction: Interaction) -> None:
         modal: GuessModal = GuessModal(game=self)
         await interaction.response.send_modal(modal)
     
+    @discord.ui.button(label="◀", style=ButtonStyle.secondary)
+    async def previous_page_callback(self, button: discord.ui.Button, interaction: Interaction) -> None:
+        await interaction.response.defer()
+        await self.turn_page(-1)
+    
+    @discord.ui.button(label="▶", style=ButtonStyle.secondary)
+    async def next_page_callback(self, button: discord.ui.Button, interaction: Interaction) -> None:
+        await interaction.response.defer()
+        await self.turn_page(1)
+    
+    @discord.ui.button(label="📍 My Position", style=ButtonStyle.secondary)
+    async def position_callback(self, button: discord.ui.Button, interaction: Interaction) -> None:
+        player: Optional[Player] = self.players.get(interaction.user.id)
+        board: Leaderboard = self.eliminated_board if player and player.is_eliminated() else self.active_board
+        embed: Embed = Embed(title="📍 Your Position", color=discord.Color.blue(),
+                             description=board.render_context(player, limit=EMBED_DESCRIPTION_LIMIT) or "No players")
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+    
+    def get_page_count(self) -> int:
+        return max(self.active_board.page_count, self.eliminated_board.page_count)
+    
+    async def turn_page(self, step: int) -> None:
+        self.page = (self.page + step) % self.get_page_count()
+        await self.editor.edit(embed=self.get_embed(show_guesses=self.state == "showing_answers"))
+    
+    # Leaderboard lines are only formatted again when the state they show changes
+    def get_active_state(self, player: Player) -> Hashable:
+        if not self.show_results:
+            return player.hp
+        return player.hp, player.damage, player.guess, player.damage == self.players.lowest_damage
+    
+    def format_active_line(self, player: Player, state: Hashable) -> str:
+        player_info: str = f"<@{player.id}> | HP: `{simplify_number(player.hp)}`"
+        if self.show_results:
+            player_info += f' | Damage: `{simplify_number(player.damage)}` | Guessed: `{simplify_number(player.guess or 1)}`'
+            if player.damage == self.players.lowest_damage:
+                player_info += " 👑"
+        return player_info
+    
+    def get_eliminated_state(self, player: Player) -> Hashable:
+        return player.eliminated_round, player.hp, player.guess
+    
+    def format_eliminated_line(self, player: Player, state: Hashable) -> str:
+        player_info: str = f"<@{player.id}> | Eliminated: Round {player.eliminated_round}"
+        if player.guess is not None:
+            player_info += f" | HP: `{simplify_number(player.hp)}` | Last Guess: `{simplify_number(player.guess)}`"
+        return player_info
+    
     def get_embed(self, show_guesses: bool = False, add_time: bool = False, game_over: bool = False) -> Embed:
         if game_over:
             title = '🏁 Game Over!'
@@ -189,60 +293,38 @@ class GameView(discord.ui.View):
         if add_time:
             embed.add_field(name="⏳ Time Remaining", value=f"Guessing ends {get_future_time(self.guess_time)}", inline=False)
         
-        if show_guesses or game_over:
+        if (show_guesses or game_over) and self.current_video:
             current_round_info = (
                 f"🎯 Actual Rank: `{simplify_number(self.real_rank)}`\n"
-                f"👤 Player: [Profile](https://osu.ppy.sh/users/{self.current_video['player_id']})\n"
-                f"🗺️ Map: [Beatmap](https://osu.ppy.sh/b/{self.current_video['map_id']})\n"
-                f"🏆 Score: [Link](https://osu.ppy.sh/scores/osu/{self.current_video['score_id']})"
+                f"👤 Player: {get_label(format_user(self.current_video['player_id']))}[Profile](https://osu.ppy.sh/users/{self.current_video['player_id']})\n"
+                f"🗺️ Map: {get_label(format_beatmap(self.current_video['map_id']))}[Beatmap](https://osu.ppy.sh/b/{self.current_video['map_id']})"
             )
+            if self.current_video.get("score_id"):
+                current_round_info += f"\n🏆 Score: [Link](https://osu.ppy.sh/scores/osu/{self.current_video['score_id']})"
             embed.add_field(name="📊 Current Round Results", value=current_round_info, inline=False)
     
-        # Active players
-        active_players = []
-        
-        alive_players = self.alive_players
-        
-        if len(alive_players) > 0:
-            lowest_damage = min(player.get_damage(self.real_rank, self.round) for player in alive_players)
-        else:
-            lowest_damage = 0
-
-        self.players.sort(key=lambda p: p.hp, reverse=True)
-        
-        for player in self.players:
-            if not player.is_eliminated():
-                player_info = f"<@{player.id}> | HP: `{simplify_number(player.hp)}`"
-                if show_guesses or game_over:
-                    damage = player.get_damage(self.real_rank, self.round)
-                    player_info += f' | Damage: `{simplify_number(damage)}` | Guessed: `{simplify_number(player.guess or 1)}`'
-                    
-                    if damage == lowest_damage:
-                        player_info += f" 👑"
-                    
-                active_players.append(player_info)
-            
-        if active_players:
-            embed.add_field(name="Active Players", value="\n".join(active_players), inline=False)
-        
-        # Eliminated players
-        eliminated_players = []
-        for player in self.players:
-            if player.is_eliminated():
-                player_info = f"<@{player.id}> | Eliminated: Round {player.eliminated_round}"
-                if player.guess is not None:
-                    player_info += f" | HP: `{simplify_number(player.hp)}` | Last Guess: `{simplify_number(player.guess)}`"
-                eliminated_players.append(player_info)
-        
-        if eliminated_players:
-            embed.add_field(name="💀 Eliminated Players", value="\n".join(eliminated_players), inline=False)
-        
-        if self.previous_video and not show_guesses or game_over:
+        # Alive players come first in the ranking, they are the only ones with HP left
+        self.show_results = show_guesses or game_over
+        ranking: List[Player] = self.players.ranking
+        self.active_board.set_order(ranking[:self.players.alive_count])
+        self.eliminated_board.set_order(ranking[self.players.alive_count:])
+        page_count: int = self.get_page_count()
+        self.page = min(self.page, page_count - 1)
+        page_info: str = f" · Page {self.page + 1}/{page_count}" if page_count > 1 else ""
+        
+        if len(self.active_board):
+            embed.add_field(name=f"Active Players ({len(self.active_board)}){page_info}", value=self.active_board.render_page(self.page), inline=False)
+        
+        if len(self.eliminated_board):
+            embed.add_field(name=f"💀 Eliminated Players ({len(self.eliminated_board)})", value=self.eliminated_board.render_page(self.page), inline=False)
+        
+        if self.previous_video and (not show_guesses or game_over):
             prev_round_info = (
-                f"[Player](https://osu.ppy.sh/users/{self.previous_video['player_id']}) -"
-                f" [Beatmap](https://osu.ppy.sh/b/{self.previous_video['map_id']}) -"
-                f" [Score](https://osu.ppy.sh/scores/osu/{self.previous_video['score_id']})"
+                f"{get_label(format_user(self.previous_video['player_id']))}[Player](https://osu.ppy.sh/users/{self.previous_video['player_id']}) -"
+                f" {get_label(format_beatmap(self.previous_video['map_id']))}[Beatmap](https://osu.ppy.sh/b/{self.previous_video['map_id']})"
             )
+            if self.previous_video.get("score_id"):
+                prev_round_info += f" - [Score](https://osu.ppy.sh/scores/osu/{self.previous_video['score_id']})"
             embed.add_field(name="Previous Round", value=prev_round_info, inline=False)
 
         # Footer
@@ -257,69 +339,105 @@ class GameView(discord.ui.View):
         return embed
 
 
+    async def prepare_round(self) -> Optional[PreparedClip]:
+        while True:
+            video: Optional[Dict[str, Any]] = video_pool.reserve(id(self), self.policy(video_pool.free, self.rounds_prepared + 1))
+            if video is None:
+                return None
+            try:
+                data: bytes = await asyncio.to_thread(read_file, video["path"])
+                prepared: PreparedClip = PreparedClip(info=video, data=data)
+                # Names and titles for the results, looked up while the round before this one is played
+                osu_metadata.warm(beatmap_ids=[video["map_id"]], user_ids=[video["player_id"]])
+            except OSError as e:
+                print(f"Skipping unreadable video {video['path']}: {e}")
+                await video_pool.release(id(self), video["path"], played=True)
+                continue
+            except BaseException:
+                # Cancelled or broken, either way the clip goes back to the pool instead of staying reserved
+                await video_pool.release(id(self), video["path"])
+                raise
+            self.rounds_prepared += 1
+            return prepared
+
     async def next_round(self, update: bool = True) -> None:
         # Set the previous video before moving to the next one
         self.previous_video = self.current_video
 
-        # delete the old video
+        # The pool deletes the old video once no other game is holding it
         if self.current_video:
-            os.remove(self.current_video["path"])
-            os.remove(f"{self.current_video['path'].split('.')[0]}.json")
+            await video_pool.release(id(self), self.current_video["path"], played=True)
         
-        self.current_video = self.videos_info.pop(0)
+        # Read while the previous round was still being played
+        prepared: Optional[PreparedClip] = await self.prefetcher.get()
+        
+        if prepared is None:
+            print("Ran out of videos, ending game")
+            await self.end_game()
+            return
+        
+        self.current_video = prepared.info
         self.real_rank = self.current_video["rank"]
         self.round_start: float = time.time()
         self.state = "getting_guesses"
         
-        discord_video: File = File(self.current_video["path"], filename="video.mp4")
+        discord_video: File = File(BytesIO(prepared.data), filename="video.mp4")
         
-        for player in self.players:
-            player.reset_guess()
+        self.players.new_round()
             
         self.message.attachments.clear()
         
-        await self.message.edit(embed=self.get_embed(), view=self, file=discord_video)
+        upload_start: float = time.perf_counter()
+        await self.editor.edit(embed=self.get_embed(), view=self, file=discord_video)
+        print(f"Round {self.round}: uploaded {len(prepared.data) / 1024 / 1024:.2f}MB clip in {time.perf_counter() - upload_start:.2f}s"
+              f"{'' if prepared.info.get('transcoded') else ' (not transcoded)'}")
     
     
     async def player_guess(self, player_id: int, guess: int) -> None:
-        
-        player = next((p for p in self.players if p.id == player_id), Player(player_id, self.starting_hp/self.round))
-        
-        if player.is_eliminated():
+        if self.state != "getting_guesses":
             return
         
-        player.make_guess(guess)
+        # Players who didn't sign up, or are already out, can't guess
+        if not self.players.guess(player_id, guess):
+            return
         
-        if all(p.guess is not None or p.is_eliminated() for p in self.players):
-            self.state = "showing_answers"
+        if self.players.all_guessed:
             await self.show_answers()
         
         
     async def show_answers(self) -> None:
-        for player in self.players:
-            if not player.is_eliminated():
-                damage = player.get_damage(self.real_rank, self.round)
-                player.take_damage(damage)
-                
-                if player.is_eliminated():
-                    player.eliminate(self.round)
+        if self.state != "getting_guesses":
+            return
+        self.state = "showing_answers"
+        
+        self.players.apply_damage(self.real_rank, self.round)
                     
-        if len(self.alive_players) < 1:
+        if self.players.alive_count < 1:
             await self.end_game()
             return
         
         # If someone's playing solo We don't want to end the game early
-        elif len(self.players) > 1 and len(self.alive_players) == 1:
+        elif len(self.players) > 1 and self.players.alive_count == 1:
             await self.end_game()
             return
         
-        await self.message.edit(embed=self.get_embed(show_guesses=True), view=self)
-        await asyncio.sleep(12)
+        await self.editor.edit(embed=self.get_embed(show_guesses=True), view=self)
+        self.timer = timer_service.schedule(12, self.advance)
+
+    async def advance(self) -> None:
+        self.state = "getting_next_map"
         self.round += 1
         await self.next_round()
 
     async def end_game(self) -> None:
-        await self.message.edit(embed=self.get_embed(game_over=True), view=None)
+        if self.timer:
+            self.timer.cancel()
+        self.prefetcher.stop()
+        for prepared in self.prefetcher.drain():
+            await video_pool.release(id(self), prepared.info["path"])
+        if self.current_video:
+            await video_pool.release(id(self), self.current_video["path"], played=True)
+        await self.editor.edit(embed=self.get_embed(game_over=True), view=None)
 
 class GuessModal(discord.ui.Modal):
     def __init__(self, game: GameView, *args, **kwargs) -> None:
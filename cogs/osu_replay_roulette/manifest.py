@@ -0,0 +1,152 @@
+import os
+import json
+import sqlite3
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple
+
+VIDEO_DIRECTORY: str = "cogs/osu_replay_roulette/videos"
+
+
+class VideoManifest:
+    # Everything needed to pick a clip, kept in sqlite so a game start is one query instead of a parse of every sidecar
+    _instance: Optional['VideoManifest'] = None
+
+    def __init__(self, path: str = 'cogs/osu_replay_roulette/manifest.db', video_directory: str = VIDEO_DIRECTORY) -> None:
+        self.path: str = path
+        self.video_directory: str = video_directory
+        self.lock: asyncio.Lock = asyncio.Lock()
+
+        conn: sqlite3.Connection = self.connect()
+        c: sqlite3.Cursor = conn.cursor()
+
+        c.execute('''CREATE TABLE IF NOT EXISTS videos
+                    (name TEXT PRIMARY KEY,
+                    rank INTEGER,
+                    map_id INTEGER,
+                    mapset_id INTEGER,
+                    player_id INTEGER,
+                    score_id INTEGER,
+                    size INTEGER,
+                    mtime REAL,
+                    json_mtime REAL,
+                    bitrate INTEGER,
+                    transcoded INTEGER DEFAULT 0)''')
+        
+        # Manifests made before transcoding existed are missing its columns
+        columns: List[str] = [row[1] for row in c.execute("PRAGMA table_info(videos)")]
+        if "transcoded" not in columns:
+            c.execute("ALTER TABLE videos ADD COLUMN bitrate INTEGER")
+            c.execute("ALTER TABLE videos ADD COLUMN transcoded INTEGER DEFAULT 0")
+
+        c.execute('''CREATE INDEX IF NOT EXISTS idx_videos_rank ON videos(rank)''')
+
+        c.execute('''CREATE TABLE IF NOT EXISTS manifest_state
+                    (key TEXT PRIMARY KEY,
+                    value REAL)''')
+
+        conn.commit()
+        conn.close()
+
+    def connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def get_path(self, name: str) -> str:
+        return f"{self.video_directory}/{name}"
+
+    def read_metadata(self, name: str) -> Optional[Dict[str, Any]]:
+        # The data builder notebook only writes map_id and player_id, older clips may have more
+        try:
+            with open(self.get_path(f"{name[:-4]}.json"), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def scan(self, force: bool = False) -> Tuple[int, int]:
+        conn: sqlite3.Connection = self.connect()
+        try:
+            c: sqlite3.Cursor = conn.cursor()
+            try:
+                directory_mtime: float = os.stat(self.video_directory).st_mtime
+            except OSError:
+                return 0, 0
+
+            # Adding, removing or renaming a clip bumps the directory mtime, when it hasn't moved nothing needs looking at
+            row = c.execute("SELECT value FROM manifest_state WHERE key = 'directory_mtime'").fetchone()
+            if not force and row is not None and row[0] == directory_mtime:
+                return 0, 0
+
+            known: Dict[str, Tuple[int, float, float]] = {name: (size, mtime, json_mtime) for name, size, mtime, json_mtime in
+                                                           c.execute("SELECT name, size, mtime, json_mtime FROM videos")}
+            jsons: Dict[str, float] = {}
+            videos: Dict[str, Tuple[int, float]] = {}
+            for entry in os.scandir(self.video_directory):
+                if entry.name.endswith(".json"):
+                    jsons[entry.name[:-5]] = entry.stat().st_mtime
+                elif entry.name.endswith(".mp4") and entry.name[:-4].isdigit():
+                    stat = entry.stat()
+                    videos[entry.name] = (stat.st_size, stat.st_mtime)
+
+            changed: List[Tuple] = []
+            for name, (size, mtime) in videos.items():
+                json_mtime: Optional[float] = jsons.get(name[:-4])
+                if json_mtime is None or known.get(name) == (size, mtime, json_mtime):
+                    continue
+                metadata: Optional[Dict[str, Any]] = self.read_metadata(name)
+                if metadata is None:
+                    continue
+                transcoded: Dict[str, Any] = metadata.get("transcoded") or {}
+                changed.append((name, int(name[:-4]), metadata.get("map_id"), metadata.get("mapset_id"), metadata.get("player_id"),
+                                metadata.get("score_id"), size, mtime, json_mtime, transcoded.get("bitrate"), bool(transcoded)))
+
+            removed: List[Tuple[str]] = [(name,) for name in known if name not in videos or name[:-4] not in jsons]
+
+            c.executemany('''INSERT OR REPLACE INTO videos (name, rank, map_id, mapset_id, player_id, score_id, size, mtime, json_mtime, bitrate, transcoded)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', changed)
+            c.executemany("DELETE FROM videos WHERE name = ?", removed)
+            c.execute("INSERT OR REPLACE INTO manifest_state (key, value) VALUES ('directory_mtime', ?)", (directory_mtime,))
+            conn.commit()
+            return len(changed), len(removed)
+        finally:
+            conn.close()
+
+    async def refresh(self, force: bool = False) -> None:
+        async with self.lock:
+            changed, removed = await asyncio.to_thread(self.scan, force)
+        if changed or removed:
+            print(f"Video manifest updated: {changed} clips added or changed, {removed} removed")
+
+    def query(self) -> List[Dict[str, Any]]:
+        conn: sqlite3.Connection = self.connect()
+        try:
+            rows = conn.execute("SELECT name, rank, map_id, mapset_id, player_id, score_id, size, bitrate, transcoded FROM videos").fetchall()
+        finally:
+            conn.close()
+        return [{"path": self.get_path(name), "rank": rank, "map_id": map_id, "mapset_id": mapset_id, "player_id": player_id,
+                 "score_id": score_id, "size": size, "bitrate": bitrate, "transcoded": bool(transcoded)}
+                for name, rank, map_id, mapset_id, player_id, score_id, size, bitrate, transcoded in rows]
+
+    async def get_videos(self) -> List[Dict[str, Any]]:
+        await self.refresh()
+        return await asyncio.to_thread(self.query)
+
+    def delete(self, name: str) -> None:
+        conn: sqlite3.Connection = self.connect()
+        try:
+            conn.execute("DELETE FROM videos WHERE name = ?", (name,))
+            conn.commit()
+        finally:
+            conn.close()
+
+    async def remove(self, path: str) -> None:
+        await asyncio.to_thread(self.delete, os.path.basename(path))
+
+    @classmethod
+    def get_instance(cls) -> 'VideoManifest':
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+video_manifest = VideoManifest.get_instance()
@@ -0,0 +1,124 @@
+import math
+import random
+import bisect
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+BUCKETS_PER_DECADE: int = 8
+
+
+class RankIndex:
+    # Clips grouped into log-scale rank buckets. The ids of non-empty buckets are kept sorted, so the bucket closest to
+    # any target rank is one bisect away and a clip is taken out of it in O(1)
+    def __init__(self, buckets_per_decade: int = BUCKETS_PER_DECADE) -> None:
+        self.buckets_per_decade: int = buckets_per_decade
+        self.buckets: Dict[int, List[str]] = {}
+        self.positions: Dict[str, Tuple[int, int]] = {}
+        self.nonempty: List[int] = []
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def __contains__(self, path: str) -> bool:
+        return path in self.positions
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self.positions))
+
+    def get_bucket(self, log_rank: float) -> int:
+        return math.floor(log_rank * self.buckets_per_decade)
+
+    def add(self, path: str, rank: int) -> None:
+        if path in self.positions:
+            return
+        bucket_id: int = self.get_bucket(math.log10(max(rank, 1)))
+        bucket: Optional[List[str]] = self.buckets.get(bucket_id)
+        if bucket is None:
+            bucket = self.buckets[bucket_id] = []
+            bisect.insort(self.nonempty, bucket_id)
+        self.positions[path] = (bucket_id, len(bucket))
+        bucket.append(path)
+
+    def remove(self, path: str) -> None:
+        bucket_id, i = self.positions.pop(path)
+        bucket: List[str] = self.buckets[bucket_id]
+        last: str = bucket.pop()
+        if last != path:
+            bucket[i] = last
+            self.positions[last] = (bucket_id, i)
+        if not bucket:
+            del self.buckets[bucket_id]
+            del self.nonempty[bisect.bisect_left(self.nonempty, bucket_id)]
+
+    def get_log_range(self) -> Tuple[float, float]:
+        if not self.nonempty:
+            return 0.0, 0.0
+        return self.nonempty[0] / self.buckets_per_decade, (self.nonempty[-1] + 1) / self.buckets_per_decade
+
+    def nearest_bucket(self, log_rank: float) -> int:
+        target: int = self.get_bucket(log_rank)
+        i: int = bisect.bisect_left(self.nonempty, target)
+        if i == len(self.nonempty):
+            return self.nonempty[-1]
+        if i == 0 or self.nonempty[i] == target:
+            return self.nonempty[i]
+        below, above = self.nonempty[i - 1], self.nonempty[i]
+        return below if target - below <= above - target else above
+
+    def take(self, log_rank: Optional[float] = None) -> Optional[str]:
+        # Takes a random clip from the bucket nearest to log_rank, or any clip with equal odds when it's None
+        if not self.positions:
+            return None
+        if log_rank is None:
+            sizes: List[int] = [len(self.buckets[bucket_id]) for bucket_id in self.nonempty]
+            bucket_id: int = random.choices(self.nonempty, weights=sizes)[0]
+        else:
+            bucket_id = self.nearest_bucket(log_rank)
+        bucket: List[str] = self.buckets[bucket_id]
+        path: str = bucket[random.randrange(len(bucket))]
+        self.remove(path)
+        return path
+
+
+# Given the free clips and the round about to be prepared, returns the log10 rank to aim for, None means any clip
+SelectionPolicy = Callable[[RankIndex, int], Optional[float]]
+
+def any_clip(index: RankIndex, round: int) -> Optional[float]:
+    return None
+
+def uniform_log_rank(index: RankIndex, round: int) -> Optional[float]:
+    # Every order of magnitude that has clips is equally likely, so top 100 clips don't crowd out the rest
+    low, high = index.get_log_range()
+    return random.uniform(low, high)
+
+def widening_log_rank(index: RankIndex, round: int) -> Optional[float]:
+    # Starts around the middle of the catalog and opens up to the extremes as the game goes on
+    low, high = index.get_log_range()
+    middle: float = (low + high) / 2
+    spread: float = (high - low) / 2 * min(1.0, round / 10)
+    return random.uniform(middle - spread, middle + spread)
+
+SELECTION_POLICIES: Dict[str, SelectionPolicy] = {
+    "any": any_clip,
+    "uniform_log_rank": uniform_log_rank,
+    "widening_log_rank": widening_log_rank,
+}
+
+
+if __name__ == "__main__":
+    import time
+
+    # Benchmark: python -m cogs.osu_replay_roulette.rank_index
+    for size in (1_000, 10_000, 100_000):
+        index = RankIndex()
+        ranks: Dict[str, int] = {f"{i}.mp4": int(10 ** random.uniform(0, 6)) for i in range(size)}
+        for path, rank in ranks.items():
+            index.add(path, rank)
+
+        for name, policy in SELECTION_POLICIES.items():
+            draws: int = 20_000
+            start: float = time.perf_counter()
+            for round in range(draws):
+                path = index.take(policy(index, round % 20))
+                index.add(path, ranks[path])
+            elapsed: float = time.perf_counter() - start
+            print(f"{size:>7,} clips, {name:<18}: {elapsed / draws * 1e6:.2f}us per take + add")
@@ -0,0 +1,145 @@
+import os
+import json
+import time
+import shutil
+import asyncio
+from typing import Any, Callable, Dict, List, Optional, Set
+
+# Discord's attachment limit for guilds without boosts, with some room for the rest of the message
+MAX_UPLOAD_BYTES: int = 10 * 1024 * 1024
+TARGET_BYTES: int = 9 * 1024 * 1024
+MAX_VIDEO_BITRATE: int = 2_500_000
+AUDIO_BITRATE: int = 96_000
+# Long clips can't get under the target at any watchable bitrate, they end up over the limit and are left out instead
+MIN_VIDEO_BITRATE: int = 250_000
+
+
+class ClipTranscoder:
+    # Brings clips to a size and bitrate that uploads quickly, with the moov atom up front so playback starts right away.
+    # Runs ffmpeg in the background, clips over the upload limit stay out of the pool until they have been through it
+    _instance: Optional['ClipTranscoder'] = None
+
+    def __init__(self, workers: int = max(1, (os.cpu_count() or 2) // 2), timeout: float = 300) -> None:
+        self.workers: int = workers
+        self.timeout: float = timeout
+        self.ffmpeg: Optional[str] = shutil.which("ffmpeg")
+        self.ffprobe: Optional[str] = shutil.which("ffprobe")
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.queued: Set[str] = set()
+        self.failed: Set[str] = set()
+        self.tasks: List[asyncio.Task] = []
+        # Called with the path of every clip that finished transcoding
+        self.listeners: List[Callable[[str], None]] = []
+        # Set by the video pool, clips a game is holding are skipped and picked up again on a later submit
+        self.in_use: Optional[Callable[[str], bool]] = None
+
+    def submit(self, paths: List[str]) -> None:
+        if self.ffmpeg is None:
+            if paths and not self.failed:
+                print(f"ffmpeg not found, clips over {MAX_UPLOAD_BYTES} bytes will be left out of games")
+            self.failed.update(paths)
+            return
+
+        for path in paths:
+            if path not in self.queued and path not in self.failed:
+                self.queued.add(path)
+                self.queue.put_nowait(path)
+
+        self.tasks = [task for task in self.tasks if not task.done()]
+        while self.queued and len(self.tasks) < self.workers:
+            self.tasks.append(asyncio.create_task(self.run()))
+
+    async def run(self) -> None:
+        while not self.queue.empty():
+            path: str = self.queue.get_nowait()
+            try:
+                if self.in_use is not None and self.in_use(path):
+                    continue
+                await self.transcode(path)
+                for listener in self.listeners:
+                    listener(path)
+            except Exception as e:
+                print(f"Transcoding {path} failed: {e!r}")
+                self.failed.add(path)
+            finally:
+                self.queued.discard(path)
+
+    async def execute(self, *args: str) -> bytes:
+        process = await asyncio.create_subprocess_exec(*args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), self.timeout)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            raise
+        if process.returncode != 0:
+            lines: List[str] = stderr.decode(errors="replace").strip().splitlines()
+            raise RuntimeError(lines[-1] if lines else f"exit code {process.returncode}")
+        return stdout
+
+    async def probe(self, path: str) -> Dict[str, float]:
+        if self.ffprobe is None:
+            return {}
+        output: bytes = await self.execute(self.ffprobe, "-v", "error", "-show_entries", "format=duration,bit_rate", "-of", "json", path)
+        fmt: Dict[str, Any] = json.loads(output).get("format", {})
+        return {key: float(value) for key, value in fmt.items() if value not in (None, "N/A")}
+
+    async def transcode(self, path: str) -> None:
+        start: float = time.perf_counter()
+        size: int = os.path.getsize(path)
+        info: Dict[str, float] = await self.probe(path)
+        duration: float = info.get("duration") or 30
+        bitrate: float = info.get("bit_rate") or size * 8 / duration
+
+        video_bitrate: int = int(max(MIN_VIDEO_BITRATE, min(MAX_VIDEO_BITRATE, TARGET_BYTES * 8 / duration - AUDIO_BITRATE)))
+        tmp_path: str = f"{os.path.dirname(path)}/.{os.path.basename(path)}.tmp.mp4"
+
+        if size <= TARGET_BYTES and bitrate <= MAX_VIDEO_BITRATE + AUDIO_BITRATE:
+            # Already small enough, only the container needs faststart
+            codec_args: List[str] = ["-c", "copy"]
+            video_bitrate = int(bitrate)
+        else:
+            codec_args = ["-c:v", "libx264", "-preset", "veryfast", "-b:v", str(video_bitrate), "-maxrate", str(video_bitrate),
+                          "-bufsize", str(video_bitrate * 2), "-pix_fmt", "yuv420p", "-c:a", "aac", "-b:a", str(AUDIO_BITRATE)]
+
+        try:
+            await self.execute(self.ffmpeg, "-y", "-v", "error", "-i", path, *codec_args, "-movflags", "+faststart", tmp_path)
+            new_size: int = os.path.getsize(tmp_path)
+            if new_size > MAX_UPLOAD_BYTES:
+                raise RuntimeError(f"still {new_size} bytes after transcoding")
+            # The pool may have deleted the clip meanwhile, replacing it would bring back a video without its sidecar
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"{path} was removed while transcoding")
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        json_path: str = f"{path[:-4]}.json"
+        try:
+            with open(json_path, "r") as f:
+                metadata: Dict[str, Any] = json.load(f)
+        except FileNotFoundError:
+            # Deleted between the check and the replace, don't leave the new video behind on its own
+            if os.path.exists(path):
+                os.remove(path)
+            raise
+        metadata["transcoded"] = {"bytes": new_size, "original_bytes": size, "bitrate": video_bitrate, "faststart": True, "at": time.time()}
+        # Replaced rather than rewritten so a manifest scan never reads half a file
+        tmp_json_path: str = f"{os.path.dirname(path)}/.{os.path.basename(json_path)}.tmp"
+        with open(tmp_json_path, "w") as f:
+            json.dump(metadata, f, indent=4)
+        os.replace(tmp_json_path, json_path)
+
+        print(f"Transcoded {path}: {size / 1024 / 1024:.1f}MB -> {new_size / 1024 / 1024:.1f}MB in {time.perf_counter() - start:.1f}s")
+
+    def get_stats(self) -> Dict[str, int]:
+        return {"queued": len(self.queued), "failed": len(self.failed), "workers": len([task for task in self.tasks if not task.done()])}
+
+    @classmethod
+    def get_instance(cls) -> 'ClipTranscoder':
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+clip_transcoder = ClipTranscoder.get_instance()
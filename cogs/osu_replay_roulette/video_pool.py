@@ -0,0 +1,152 @@
+import os
+import time
+import random
+import asyncio
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Set
+from .manifest import video_manifest, VideoManifest
+from .rank_index import RankIndex
+from .transcoder import clip_transcoder, MAX_UPLOAD_BYTES
+from osu_metadata import osu_metadata
+
+
+class VideoPool:
+    # Clips are shared by every running game. A clip is held by each game that reserved it and is only deleted once it
+    # has been played and the last game holding it lets go
+    _instance: Optional['VideoPool'] = None
+
+    def __init__(self, manifest: VideoManifest = video_manifest, low_watermark: int = 20, usage_window: float = 60 * 60) -> None:
+        self.manifest: VideoManifest = manifest
+        self.low_watermark: int = low_watermark
+        self.usage_window: float = usage_window
+        self.clips: Dict[str, Dict[str, Any]] = {}
+        # Unreserved clips by rank
+        self.free: RankIndex = RankIndex()
+        self.holders: Dict[str, Set[int]] = {}
+        self.retiring: Set[str] = set()
+        self.played: Deque[float] = deque()
+        self.low: bool = False
+        # Called with the pool depth whenever it drops to the low watermark
+        self.low_watermark_listeners: List[Callable[[int], None]] = []
+        self.refill_task: Optional[asyncio.Task] = None
+        clip_transcoder.listeners.append(self.on_transcoded)
+        clip_transcoder.in_use = self.is_in_use
+
+    @property
+    def depth(self) -> int:
+        return len(self.free)
+
+    def add_free(self, path: str) -> None:
+        self.free.add(path, self.clips[path]["rank"])
+
+    async def load(self) -> None:
+        videos: List[Dict[str, Any]] = await self.manifest.get_videos()
+        on_disk: Set[str] = {video["path"] for video in videos}
+
+        clip_transcoder.submit([video["path"] for video in videos if not video["transcoded"]])
+
+        for video in videos:
+            if video["path"] in self.clips:
+                self.clips[video["path"]].update(video)
+            elif video["transcoded"] or video["size"] <= MAX_UPLOAD_BYTES:
+                # Clips too big to upload wait for the transcoder
+                self.clips[video["path"]] = video
+                self.add_free(video["path"])
+
+        for path in [path for path in self.free if path not in on_disk]:
+            self.free.remove(path)
+            del self.clips[path]
+
+        # Only what isn't cached yet is looked up, in batches
+        osu_metadata.warm(beatmap_ids=[clip["map_id"] for clip in self.clips.values()],
+                          user_ids=[clip["player_id"] for clip in self.clips.values()])
+
+        self.check_depth()
+
+    def reserve(self, holder: int, log_rank: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        # Takes a free clip ranked as close to 10 ** log_rank as there is, or any free clip when log_rank is None
+        path: Optional[str] = self.free.take(log_rank)
+        if path is None:
+            # Nothing unreserved left, share a clip another game is holding rather than stall this one
+            shared: List[str] = [p for p, held in self.holders.items() if holder not in held and p not in self.retiring]
+            if not shared:
+                return None
+            path = random.choice(shared)
+
+        self.holders.setdefault(path, set()).add(holder)
+        self.check_depth()
+        return self.clips[path]
+
+    async def release(self, holder: int, path: str, played: bool = False) -> None:
+        held: Set[int] = self.holders.get(path, set())
+        if holder not in held:
+            return
+        held.discard(holder)
+        if played and path not in self.retiring:
+            self.retiring.add(path)
+            self.played.append(time.time())
+
+        if held:
+            return
+        self.holders.pop(path, None)
+
+        if path in self.retiring:
+            # Forgotten only after the files are gone, so a manifest scan running meanwhile can't hand it out again
+            await asyncio.to_thread(delete_clip, path)
+            await self.manifest.remove(path)
+            self.retiring.discard(path)
+            self.clips.pop(path, None)
+        elif path in self.clips:
+            self.add_free(path)
+            self.check_depth()
+
+    def is_in_use(self, path: str) -> bool:
+        return path in self.holders or path in self.retiring
+
+    def on_transcoded(self, path: str) -> None:
+        if path not in self.clips and (self.refill_task is None or self.refill_task.done()):
+            self.refill_task = asyncio.create_task(self.load())
+
+    def check_depth(self) -> None:
+        low: bool = self.depth <= self.low_watermark
+        if low and not self.low:
+            print(f"Video pool is down to {self.depth} clips")
+            for listener in self.low_watermark_listeners:
+                listener(self.depth)
+            # New clips may have been rendered into the directory since the last scan
+            if self.refill_task is None or self.refill_task.done():
+                self.refill_task = asyncio.create_task(self.load())
+        self.low = low
+
+    def get_usage_rate(self) -> float:
+        # Clips played per hour over the usage window
+        cutoff: float = time.time() - self.usage_window
+        while self.played and self.played[0] < cutoff:
+            self.played.popleft()
+        return len(self.played) * 60 * 60 / self.usage_window
+
+    def get_stats(self) -> Dict[str, Any]:
+        rate: float = self.get_usage_rate()
+        return {
+            "depth": self.depth,
+            "held": len(self.holders),
+            "retiring": len(self.retiring),
+            "played_per_hour": rate,
+            "hours_left": self.depth / rate if rate else None,
+        }
+
+    @classmethod
+    def get_instance(cls) -> 'VideoPool':
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+
+def delete_clip(path: str) -> None:
+    for file in (path, f"{path[:-4]}.json"):
+        try:
+            os.remove(file)
+        except OSError as e:
+            print(f"Failed to remove {file}: {e}")
+
+video_pool = VideoPool.get_instance()
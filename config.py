@@ -1,5 +1,5 @@
-from dataclasses import dataclass
-from typing import Optional
+from dataclasses import dataclass, field
+from typing import Any, Optional
 import os
 import json
 
@@ -27,6 +27,8 @@ class Config:
     presets: list[Preset]
     servers: list[Server]
     active_preset: str = 'default'
+    # Tunables shared by every preset, cogs fall back to their own defaults for anything left out
+    settings: dict[str, Any] = field(default_factory=dict)
     _instance: Optional['Config'] = None
     
     def get_api_key(self, service: str) -> str:
@@ -38,6 +40,9 @@ class Config:
         
         return default
     
+    def get_setting(self, name: str, default: Any = None) -> Any:
+        return self.settings.get(name, default)
+    
     def get_servers(self, cog_name:str = 'default') -> list[int]:
         servers = []
         for preset in self.presets:
@@ -51,7 +56,7 @@ class Config:
         return [server.serverID for server in self.servers if server.name in servers]
         
     def json(self):
-        return {"presets": [preset.json() for preset in self.presets], "servers": [server.json() for server in self.servers]}
+        return {"presets": [preset.json() for preset in self.presets], "servers": [server.json() for server in self.servers], "settings": self.settings}
     
     @staticmethod
     def create():
@@ -75,7 +80,7 @@ class Config:
             data = json.load(f)
         presets = [Preset(**preset) for preset in data["presets"]]
         servers = [Server(**server) for server in data["servers"]]
-        return Config(active_preset=active_preset, presets=presets, servers=servers)
+        return Config(active_preset=active_preset, presets=presets, servers=servers, settings=data.get("settings", {}))
     
     def save(self):
         with open("config.json", "w") as f:
@@ -0,0 +1,100 @@
+import time
+import asyncio
+import weakref
+import discord
+from typing import Any, Dict, List, Optional
+
+
+class MessageEditor:
+    # Edits made while one is waiting to go out are merged into it, latest value per field wins
+    def __init__(self, message: discord.Message, scheduler: 'EditScheduler', min_interval: float) -> None:
+        self.message: discord.Message = message
+        self.scheduler: EditScheduler = scheduler
+        self.min_interval: float = min_interval
+        self.pending: Dict[str, Any] = {}
+        self.waiters: List[asyncio.Future] = []
+        self.task: Optional[asyncio.Task] = None
+        self.last_sent: float = 0
+        self.last_state: Dict[str, Any] = {}
+
+    async def edit(self, **kwargs: Any) -> None:
+        if self.pending:
+            self.scheduler.merged += 1
+        self.pending.update(kwargs)
+
+        waiter: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+        await waiter
+
+    async def run(self) -> None:
+        while self.pending:
+            delay: float = self.last_sent + self.min_interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            kwargs, waiters = self.pending, self.waiters
+            self.pending, self.waiters = {}, []
+            try:
+                await self.send(kwargs)
+            except Exception as e:
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_exception(e)
+                continue
+
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_result(None)
+
+    async def send(self, kwargs: Dict[str, Any]) -> None:
+        # The view is rendered now rather than when edit was called, so this is always the latest state of it
+        state: Dict[str, Any] = {}
+        if "embed" in kwargs:
+            state["embed"] = kwargs["embed"].to_dict() if kwargs["embed"] else None
+        if "view" in kwargs:
+            state["view"] = kwargs["view"].to_components() if kwargs["view"] else None
+
+        unchanged: bool = len(state) == len(kwargs) and all(self.last_state.get(key, ...) == value for key, value in state.items())
+        if unchanged:
+            self.scheduler.skipped += 1
+            return
+
+        await self.message.edit(**kwargs)
+        self.last_sent = time.monotonic()
+        self.last_state.update(state)
+        self.scheduler.sent += 1
+
+
+class EditScheduler:
+    _instance: Optional['EditScheduler'] = None
+
+    def __init__(self, min_interval: float = 1.0) -> None:
+        self.min_interval: float = min_interval
+        # Editors go away with the views holding their message
+        self.editors: weakref.WeakValueDictionary = weakref.WeakValueDictionary()
+        self.sent: int = 0
+        self.merged: int = 0
+        self.skipped: int = 0
+
+    def get_editor(self, message: discord.Message, min_interval: Optional[float] = None) -> MessageEditor:
+        editor: Optional[MessageEditor] = self.editors.get(message.id)
+        if editor is None:
+            editor = MessageEditor(message, self, self.min_interval if min_interval is None else min_interval)
+            self.editors[message.id] = editor
+        return editor
+
+    async def edit(self, message: discord.Message, **kwargs: Any) -> None:
+        await self.get_editor(message).edit(**kwargs)
+
+    def get_stats(self) -> Dict[str, int]:
+        return {"sent": self.sent, "merged": self.merged, "skipped": self.skipped, "editors": len(self.editors)}
+
+    @classmethod
+    def get_instance(cls) -> 'EditScheduler':
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+edit_scheduler = EditScheduler.get_instance()
@@ -0,0 +1,234 @@
+import time
+import numpy as np
+from dataclasses import dataclass
+from functools import lru_cache
+from PIL import Image, ImageDraw, ImageFont
+from io import BytesIO
+from typing import List, Optional, Tuple
+
+TILE_SIZE: Tuple[int, int] = (960, 540)
+
+# Upload time comes out of the guessing window, so grids are encoded as small as they can be while still looking fine
+GRID_MAX_BYTES: int = 1_000_000
+GRID_MIN_PSNR: float = 32.0
+# Tried in order, WebP comes out smaller but takes several times longer to encode so it's opt-in
+GRID_FORMATS: Tuple[str, ...] = ("JPEG",)
+GRID_QUALITIES: Tuple[int, ...] = (90, 85, 80, 75, 70, 65, 60, 55, 50)
+# 4:2:0 instead of full chroma, noticeably smaller for a small loss in colour detail
+GRID_CHROMA_SUBSAMPLING: bool = True
+GRID_PSNR_STRIDE: int = 4
+
+@dataclass
+class EncodedImage:
+    data: bytes
+    format: str
+    quality: int
+    subsampling: int
+    psnr: float
+    encode_time: float = 0
+
+    @property
+    def extension(self) -> str:
+        return {"JPEG": "jpg", "WEBP": "webp"}.get(self.format, self.format.lower())
+
+# Everything here runs inside the render worker processes. Spawned workers import this module by name, so it lives outside
+# the cog package and only needs numpy and Pillow, importing it must never touch bot state or files
+
+
+def resize_with_padding(image:Image.Image, desired_size:Tuple[int,int], fill_color=(0, 0, 0), resample=Image.LANCZOS):
+    ratio = min(desired_size[0] / image.width, desired_size[1] / image.height)
+    new_size = (int(image.width * ratio), int(image.height * ratio))
+    resized_image = image.resize(new_size, resample=resample)
+    new_image = Image.new("RGB", desired_size, fill_color)
+    paste_position = ((desired_size[0] - new_size[0]) // 2,
+                        (desired_size[1] - new_size[1]) // 2)
+    new_image.paste(resized_image, paste_position)
+
+    return new_image
+
+
+def get_dhash_bits(gray: np.ndarray) -> np.ndarray:
+    # gray is (n, 8, 9), each row's 8 left/right brightness comparisons make up 8 bits of a 64 bit hash
+    bits = gray[:, :, 1:] > gray[:, :, :-1]
+    return np.packbits(bits.reshape(len(gray), 64), axis=1).view('>u8')[:, 0]
+
+
+def get_dhash_input(image: Image.Image) -> np.ndarray:
+    return np.asarray(image.convert("L").resize((9, 8), Image.BILINEAR), dtype=np.int16)
+
+
+def get_dhashes(tiles: List[bytes]) -> List[int]:
+    gray = []
+    for tile in tiles:
+        img = Image.open(BytesIO(tile))
+        img.draft("L", (9, 8))
+        gray.append(get_dhash_input(img))
+    return [int(h) for h in get_dhash_bits(np.stack(gray))] if gray else []
+
+
+def prepare_tile(raw: bytes) -> Tuple[bytes, int]:
+    img = Image.open(BytesIO(raw))
+    # Lets the JPEG decoder downscale by 1/2, 1/4 or 1/8 while still leaving at least a full tile of pixels
+    img.draft("RGB", TILE_SIZE)
+    img = img.convert("RGB")
+    tile = resize_with_padding(img, TILE_SIZE)
+
+    buffer = BytesIO()
+    tile.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue(), int(get_dhash_bits(get_dhash_input(tile)[None])[0])
+
+
+def get_psnr_sample(image: Image.Image) -> np.ndarray:
+    # Every GRID_PSNR_STRIDE-th pixel each way. Unlike a filtered downscale this keeps the blocking and ringing that
+    # compression adds, at a fraction of the cost of comparing every pixel
+    return np.asarray(image)[::GRID_PSNR_STRIDE, ::GRID_PSNR_STRIDE].astype(np.float32)
+
+
+def get_psnr(reference: np.ndarray, data: bytes) -> float:
+    decoded = get_psnr_sample(Image.open(BytesIO(data)).convert("RGB"))
+    mse = float(np.mean((reference - decoded) ** 2))
+    return float("inf") if mse == 0 else 10 * np.log10(255 ** 2 / mse)
+
+
+def encode_with(image: Image.Image, format: str, quality: int, subsampling: int, optimize: bool = False) -> bytes:
+    buffer = BytesIO()
+    if format == "JPEG":
+        image.save(buffer, format=format, quality=quality, subsampling=subsampling, optimize=optimize)
+    else:
+        image.save(buffer, format=format, quality=quality, method=2)
+    return buffer.getvalue()
+
+
+def encode_image(image: Image.Image, max_bytes: int = GRID_MAX_BYTES, min_psnr: float = GRID_MIN_PSNR,
+                 formats: Tuple[str, ...] = GRID_FORMATS) -> EncodedImage:
+    # Formats are tried in order and the first one with a passing quality within budget wins, later ones are only a fallback
+    start: float = time.perf_counter()
+    reference = get_psnr_sample(image)
+    # 0 keeps full chroma (4:4:4), 2 halves it both ways (4:2:0). WebP is always 4:2:0
+    jpeg_subsampling: int = 2 if GRID_CHROMA_SUBSAMPLING else 0
+    fitting: Optional[EncodedImage] = None
+    smallest: Optional[EncodedImage] = None
+
+    for format in formats:
+        subsampling: int = jpeg_subsampling if format == "JPEG" else 2
+        passing: Optional[EncodedImage] = None
+        # Quality only goes down along the ladder, so binary search for the lowest step that still passes.
+        # Smooth backgrounds usually pass at the bottom of it, which is tried first so those take a single encode
+        lo, hi = 0, len(GRID_QUALITIES) - 1
+        mid: int = hi
+        while lo <= hi:
+            data = encode_with(image, format, GRID_QUALITIES[mid], subsampling)
+            candidate = EncodedImage(data, format, GRID_QUALITIES[mid], subsampling, get_psnr(reference, data))
+            if candidate.psnr >= min_psnr:
+                passing = candidate
+                lo = mid + 1
+            else:
+                hi = mid - 1
+            mid = (lo + hi) // 2
+            if len(data) <= max_bytes and (fitting is None or candidate.psnr > fitting.psnr):
+                fitting = candidate
+            if smallest is None or len(data) < len(smallest.data):
+                smallest = candidate
+
+        if passing is not None and len(passing.data) <= max_bytes:
+            return finish_encode(image, passing, start)
+
+    # Nothing good enough fits, take the best looking one that does, or failing that the smallest
+    return finish_encode(image, fitting or smallest, start)
+
+
+def finish_encode(image: Image.Image, best: EncodedImage, start: float) -> EncodedImage:
+    # Huffman optimization is lossless and only worth its extra pass once, on the encode that is kept
+    if best.format == "JPEG":
+        best.data = encode_with(image, best.format, best.quality, best.subsampling, optimize=True)
+    best.encode_time = time.perf_counter() - start
+    return best
+
+
+@lru_cache(maxsize=None)
+def get_font(size: int) -> ImageFont.FreeTypeFont:
+    try:
+        return ImageFont.truetype("arial.ttf", size)
+    except OSError:
+        print("arial.ttf not found, falling back to the default font")
+        try:
+            return ImageFont.load_default(size)
+        except TypeError:
+            return ImageFont.load_default()
+
+
+def draw_tile_overlay(index: int) -> Image.Image:
+    width, height = TILE_SIZE
+    font_size = int(((height + width) / 2) * 0.2)
+    font = get_font(font_size)
+
+    layer = Image.new("RGBA", TILE_SIZE, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(layer)
+    draw.line((0, 0, 0, height), fill=(0, 0, 0, 255), width=font_size//30)
+    draw.line((0, 0, width, 0), fill=(0, 0, 0, 255), width=font_size//30)
+    draw.line((width, 0, width, height), fill=(0, 0, 0, 255), width=font_size//30)
+    draw.line((0, height, width, height), fill=(0, 0, 0, 255), width=font_size//30)
+    draw.text((font_size*0.03, font_size*0.03), str(index+1), (0, 0, 0, 255), font=font)
+    draw.text((0, 0), str(index+1), (255, 255, 255, 255), font=font)
+    return layer
+
+
+@lru_cache(maxsize=1)
+def get_grid_overlay() -> Image.Image:
+    # Borders and labels never change, so all six are drawn once per worker and stamped over each grid in one pass
+    width, height = TILE_SIZE
+    overlay = Image.new("RGBA", (width * 3, height * 2), (0, 0, 0, 0))
+    for i in range(6):
+        overlay.paste(draw_tile_overlay(i), (width * (i % 3), height * (i // 3)))
+    return overlay
+
+
+def render_grid(tiles: List[bytes]) -> Image.Image:
+    width, height = TILE_SIZE
+    overlay = get_grid_overlay()
+
+    grid = Image.new("RGB", overlay.size)
+    for i, tile in enumerate(tiles):
+        grid.paste(Image.open(BytesIO(tile)), (width * (i % 3), height * (i // 3)))
+    grid.paste(overlay, (0, 0), overlay)
+    return grid
+
+
+def compose_grid(tiles: List[bytes]) -> EncodedImage:
+    return encode_image(render_grid(tiles))
+
+
+
+if __name__ == "__main__":
+    import sys
+    import random
+
+    # Micro-benchmark: python grid_render.py [rounds]
+    rounds: int = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+
+    def make_background() -> bytes:
+        noise = np.random.randint(0, 256, (27, 48, 3), dtype=np.uint8)
+        image = Image.fromarray(noise).resize((random.choice([1366, 1920, 2560]), 1080), Image.BICUBIC)
+        buffer = BytesIO()
+        image.save(buffer, format="JPEG", quality=90)
+        return buffer.getvalue()
+
+    backgrounds: List[bytes] = [make_background() for _ in range(6)]
+    get_grid_overlay()
+
+    start = time.perf_counter()
+    tiles: List[bytes] = [prepare_tile(backgrounds[i % 6])[0] for i in range(6 * rounds)]
+    tile_time: float = (time.perf_counter() - start) / len(tiles)
+
+    start = time.perf_counter()
+    for i in range(rounds):
+        render_grid(tiles[i * 6:i * 6 + 6])
+    render_time: float = (time.perf_counter() - start) / rounds
+
+    start = time.perf_counter()
+    encoded: List[EncodedImage] = [compose_grid(tiles[i * 6:i * 6 + 6]) for i in range(rounds)]
+    total_time: float = (time.perf_counter() - start) / rounds
+
+    print(f"prepare_tile: {tile_time * 1000:.1f}ms per tile")
+    print(f"render_grid:  {render_time * 1000:.1f}ms per grid")
+    print(f"compose_grid: {total_time * 1000:.1f}ms per grid including encode, {sum(len(e.data) for e in encoded) / rounds / 1024:.0f}KB average")
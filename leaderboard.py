@@ -0,0 +1,140 @@
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Sequence, Tuple
+
+# Discord counts embed text in UTF-16 code units
+EMBED_FIELD_LIMIT: int = 1024
+EMBED_DESCRIPTION_LIMIT: int = 4096
+
+
+def get_length(text: str) -> int:
+    return len(text.encode("utf-16-le")) // 2
+
+def truncate(text: str, limit: int) -> str:
+    if get_length(text) <= limit:
+        return text
+    while get_length(text) > limit - 1:
+        text = text[:-1]
+    return text + "…"
+
+
+class Leaderboard:
+    # Renders a ranked player list a page at a time, always within an embed limit. Each line is cached with the state it
+    # was formatted from, so a render only costs a state lookup per visible line and text is only rebuilt when it changed
+    def __init__(self, get_state: Callable[[Hashable], Hashable], format_line: Callable[[Hashable, Hashable], str],
+                 page_size: int = 10, limit: int = EMBED_FIELD_LIMIT, context: int = 2) -> None:
+        self.get_state: Callable[[Hashable], Hashable] = get_state
+        self.format_line: Callable[[Hashable, Hashable], str] = format_line
+        self.page_size: int = page_size
+        self.limit: int = limit
+        self.context: int = context
+        self.order: Sequence[Hashable] = []
+        self.positions: Optional[Dict[Hashable, int]] = None
+        self.lines: Dict[Hashable, Tuple[Hashable, str]] = {}
+        self.formatted: int = 0
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def set_order(self, order: Sequence[Hashable]) -> None:
+        # Keys best first, positions for viewer lookups are only worked out when someone asks for them
+        self.order = order
+        self.positions = None
+
+    @property
+    def page_count(self) -> int:
+        return max(1, -(-len(self.order) // self.page_size))
+
+    def get_line(self, key: Hashable) -> str:
+        state: Hashable = self.get_state(key)
+        cached: Optional[Tuple[Hashable, str]] = self.lines.get(key)
+        if cached is not None and cached[0] == state:
+            return cached[1]
+        line: str = self.format_line(key, state)
+        self.lines[key] = (state, line)
+        self.formatted += 1
+        return line
+
+    def get_position(self, key: Hashable) -> Optional[int]:
+        if self.positions is None:
+            self.positions = {k: i for i, k in enumerate(self.order)}
+        return self.positions.get(key)
+
+    def join(self, positions: Iterable[int], limit: Optional[int] = None) -> str:
+        # Numbered lines, a gap in positions is shown as "…". Lines that don't fit are counted in a closing note instead
+        limit = limit or self.limit
+        positions = list(positions)
+        # Room for the closing note and the newline before it is set aside up front so it always fits
+        budget: int = limit - get_length(f"\n… {len(positions)} more")
+        lines: List[str] = []
+        used: int = 0
+        previous: int = -1
+        for shown, position in enumerate(positions):
+            line: str = truncate(f"{position + 1}. {self.get_line(self.order[position])}", budget)
+            if previous >= 0 and position != previous + 1:
+                line = "…\n" + line
+            cost: int = get_length(line) + (1 if lines else 0)
+            if used + cost > budget:
+                lines.append(f"… {len(positions) - shown} more")
+                break
+            lines.append(line)
+            used += cost
+            previous = position
+        return "\n".join(lines)
+
+    def render_page(self, page: int, limit: Optional[int] = None) -> str:
+        page = min(max(page, 0), self.page_count - 1)
+        start: int = page * self.page_size
+        return self.join(range(start, min(start + self.page_size, len(self.order))), limit)
+
+    def render_context(self, key: Hashable, limit: Optional[int] = None) -> str:
+        # The top page followed by the lines around the viewer, when they aren't on it already
+        positions: List[int] = list(range(min(self.page_size, len(self.order))))
+        position: Optional[int] = self.get_position(key)
+        if position is not None:
+            around: range = range(max(position - self.context, len(positions)), min(position + self.context + 1, len(self.order)))
+            positions.extend(around)
+        return self.join(positions, limit)
+
+
+if __name__ == "__main__":
+    import time
+    import random
+
+    # Benchmark: python leaderboard.py
+    players: int = 500
+    points: Dict[int, float] = {player: 0.0 for player in range(players)}
+    guesses: Dict[int, int] = {player: -1 for player in range(players)}
+    board: Leaderboard = Leaderboard(lambda player: (points[player], guesses[player]),
+                                     lambda player, state: f"<@{10 ** 17 + player}>: {state[0]:.2f} 🤷‍♂️ {state[1]}",
+                                     limit=EMBED_DESCRIPTION_LIMIT)
+
+    renders: int = 0
+    elapsed: float = 0
+    for round in range(200):
+        for player in random.sample(range(players), players // 4):
+            points[player] += random.random()
+            guesses[player] = random.randrange(6)
+
+        start: float = time.perf_counter()
+        board.set_order(sorted(points, key=points.__getitem__, reverse=True))
+        page: str = board.render_page(round % board.page_count)
+        context: str = board.render_context(random.randrange(players))
+        elapsed += time.perf_counter() - start
+        renders += 1
+        assert get_length(page) <= EMBED_DESCRIPTION_LIMIT and get_length(context) <= EMBED_DESCRIPTION_LIMIT
+
+    print(f"{players} players: {elapsed / renders * 1e6:.1f}us per sort + page + viewer context, {board.formatted} lines formatted in {renders} renders")
+
+    # Lines longer than the limit allows still come out within it
+    board = Leaderboard(lambda player: player, lambda player, state: "🎵" * 300, page_size=50, limit=EMBED_FIELD_LIMIT)
+    board.set_order(list(range(players)))
+    page = board.render_page(0)
+    print(f"Oversized lines: {get_length(page)} of {EMBED_FIELD_LIMIT} code units, {page.count(chr(10)) + 1} lines")
+
+    # Every size of list against every limit small enough to cut it short, the closing note included
+    for count in range(1, 40):
+        board = Leaderboard(lambda player: player, lambda player, state: "🎵" * (player % 7) + str(player), page_size=count)
+        board.set_order(list(range(count)))
+        for limit in range(20, 400):
+            page = board.render_page(0, limit)
+            assert get_length(page) <= limit, f"{count} lines came out {get_length(page)} code units long with a limit of {limit}"
+    print("Every page fit its limit")
@@ -0,0 +1,216 @@
+import json
+import time
+import sqlite3
+import asyncio
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from discord.utils import escape_markdown
+from utilities import osu_api
+
+# osu! caps the list endpoints at 50 ids, beatmapsets can only be looked up one at a time
+BATCH_SIZE: int = 50
+KINDS: Tuple[str, ...] = ("beatmap", "beatmapset", "user")
+
+
+def get_beatmapset_data(beatmapset: Any) -> Dict[str, Any]:
+    return {"id": beatmapset.id, "artist": beatmapset.artist, "title": beatmapset.title, "creator": beatmapset.creator}
+
+def get_beatmap_data(beatmap: Any) -> Dict[str, Any]:
+    return {"id": beatmap.id, "beatmapset_id": beatmap.beatmapset_id, "version": beatmap.version,
+            "difficulty_rating": beatmap.difficulty_rating, "total_length": beatmap.total_length}
+
+def get_user_data(user: Any) -> Dict[str, Any]:
+    return {"id": user.id, "username": user.username, "country_code": user.country_code}
+
+
+class OsuMetadataCache:
+    # Beatmap, beatmapset and user details kept in sqlite with a TTL and in memory for rendering. Lookups are batched through
+    # the endpoints that take lists, ids the api doesn't return are remembered as missing so they aren't asked for every round.
+    # Games warm the cache for what they are about to show, so rendering only reads what's already here
+    _instance: Optional['OsuMetadataCache'] = None
+
+    def __init__(self, path: str = 'osu_metadata.db', ttl: float = 7 * 24 * 60 * 60) -> None:
+        self.path: str = path
+        self.ttl: float = ttl
+        self.entries: Dict[Tuple[str, int], Tuple[Optional[Dict[str, Any]], float]] = {}
+        self.pending: Dict[Tuple[str, int], asyncio.Future] = {}
+        self.tasks: Set[asyncio.Task] = set()
+        self.loaded: bool = False
+        self.load_lock: asyncio.Lock = asyncio.Lock()
+        self.requests: int = 0
+
+        conn: sqlite3.Connection = self.connect()
+        conn.execute('''CREATE TABLE IF NOT EXISTS metadata
+                        (kind TEXT,
+                        id INTEGER,
+                        data TEXT,
+                        fetched REAL,
+                        PRIMARY KEY (kind, id))''')
+        conn.commit()
+        conn.close()
+
+    def connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def read_entries(self) -> List[Tuple[str, int, str, float]]:
+        conn: sqlite3.Connection = self.connect()
+        try:
+            return conn.execute("SELECT kind, id, data, fetched FROM metadata WHERE fetched > ?", (time.time() - self.ttl,)).fetchall()
+        finally:
+            conn.close()
+
+    def write_entries(self, rows: List[Tuple[str, int, str, float]]) -> None:
+        conn: sqlite3.Connection = self.connect()
+        try:
+            conn.executemany("INSERT OR REPLACE INTO metadata (kind, id, data, fetched) VALUES (?, ?, ?, ?)", rows)
+            conn.execute("DELETE FROM metadata WHERE fetched < ?", (time.time() - self.ttl,))
+            conn.commit()
+        finally:
+            conn.close()
+
+    async def load(self) -> None:
+        async with self.load_lock:
+            if self.loaded:
+                return
+            rows: List[Tuple[str, int, str, float]] = await asyncio.to_thread(self.read_entries)
+            for kind, id, data, fetched in rows:
+                self.entries.setdefault((kind, id), (json.loads(data), fetched))
+            self.loaded = True
+        print(f"Loaded {len(rows)} cached osu! metadata entries")
+
+    def get_cached(self, kind: str, id: Optional[int]) -> Optional[Dict[str, Any]]:
+        # Never waits on the api, stale entries are still better than nothing to render
+        entry = self.entries.get((kind, id))
+        return entry[0] if entry is not None else None
+
+    def is_fresh(self, kind: str, id: int, now: float) -> bool:
+        entry = self.entries.get((kind, id))
+        return entry is not None and now - entry[1] < self.ttl
+
+    async def get(self, kind: str, ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+        await self.load()
+        ids = [id for id in ids if id is not None]
+        now: float = time.time()
+        missing: List[int] = []
+        waiting: List[asyncio.Future] = []
+        for id in dict.fromkeys(ids):
+            if self.is_fresh(kind, id, now):
+                continue
+            future: Optional[asyncio.Future] = self.pending.get((kind, id))
+            if future is None:
+                # Futures let concurrent lookups of the same ids wait on one request
+                self.pending[(kind, id)] = asyncio.get_running_loop().create_future()
+                missing.append(id)
+            else:
+                waiting.append(future)
+
+        if missing:
+            await self.fetch(kind, missing)
+        if waiting:
+            await asyncio.gather(*waiting)
+
+        results: Dict[int, Dict[str, Any]] = {}
+        for id in ids:
+            data: Optional[Dict[str, Any]] = self.get_cached(kind, id)
+            if data is not None:
+                results[id] = data
+        return results
+
+    async def fetch(self, kind: str, ids: List[int]) -> None:
+        found: Dict[Tuple[str, int], Optional[Dict[str, Any]]] = {}
+        failed: Set[int] = set()
+        try:
+            if kind == "beatmapset":
+                for id in ids:
+                    try:
+                        self.requests += 1
+                        found[(kind, id)] = get_beatmapset_data(await osu_api.beatmapset(id))
+                    except ValueError:
+                        # ossapi raises this when the api answers with an error, for a lookup by id that's a set that doesn't exist
+                        pass
+                    except Exception as e:
+                        print(f"Failed to look up beatmapset {id}: {e!r}")
+                        failed.add(id)
+            else:
+                for i in range(0, len(ids), BATCH_SIZE):
+                    batch: List[int] = ids[i:i + BATCH_SIZE]
+                    try:
+                        self.requests += 1
+                        if kind == "beatmap":
+                            for beatmap in await osu_api.beatmaps(batch):
+                                found[(kind, beatmap.id)] = get_beatmap_data(beatmap)
+                                # The list endpoint includes each beatmap's set, so those come for free
+                                if beatmap._beatmapset is not None:
+                                    found[("beatmapset", beatmap.beatmapset_id)] = get_beatmapset_data(beatmap._beatmapset)
+                        else:
+                            for user in await osu_api.users(batch):
+                                found[(kind, user.id)] = get_user_data(user)
+                    except Exception as e:
+                        print(f"Failed to look up {len(batch)} {kind}s: {e!r}")
+                        failed.update(batch)
+
+            now: float = time.time()
+            # Ids left out of an answer that did come back don't exist, that's worth remembering too
+            found.update({(kind, id): None for id in ids if (kind, id) not in found and id not in failed})
+            for key, data in found.items():
+                self.entries[key] = (data, now)
+            if found:
+                rows: List[Tuple[str, int, str, float]] = [(k, id, json.dumps(data), now) for (k, id), data in found.items()]
+                await asyncio.to_thread(self.write_entries, rows)
+        finally:
+            for id in ids:
+                future: Optional[asyncio.Future] = self.pending.pop((kind, id), None)
+                if future is not None and not future.done():
+                    future.set_result(None)
+
+    async def warm_now(self, beatmap_ids: Iterable[int] = (), beatmapset_ids: Iterable[int] = (), user_ids: Iterable[int] = ()) -> None:
+        beatmap_ids, beatmapset_ids = list(beatmap_ids), list(beatmapset_ids)
+        await asyncio.gather(self.get("beatmap", beatmap_ids), self.get("user", user_ids))
+        # After the beatmaps, which bring most of their sets with them
+        await self.get("beatmapset", beatmapset_ids + [data["beatmapset_id"] for data in
+                                                       (self.get_cached("beatmap", id) for id in beatmap_ids) if data])
+
+    def warm(self, beatmap_ids: Iterable[int] = (), beatmapset_ids: Iterable[int] = (), user_ids: Iterable[int] = ()) -> None:
+        # Fetches in the background, errors are logged by fetch
+        task: asyncio.Task = asyncio.create_task(self.warm_now(list(beatmap_ids), list(beatmapset_ids), list(user_ids)))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    def get_stats(self) -> Dict[str, int]:
+        stats: Dict[str, int] = {kind: 0 for kind in KINDS}
+        for kind, _ in self.entries:
+            stats[kind] += 1
+        stats["requests"] = self.requests
+        stats["pending"] = len(self.pending)
+        return stats
+
+    @classmethod
+    def get_instance(cls) -> 'OsuMetadataCache':
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+osu_metadata = OsuMetadataCache.get_instance()
+
+
+# Display text from whatever is cached, escaped for embeds. None until the cache has it
+
+def format_beatmap(beatmap_id: Optional[int]) -> Optional[str]:
+    beatmap: Optional[Dict[str, Any]] = osu_metadata.get_cached("beatmap", beatmap_id)
+    if beatmap is None:
+        return None
+    beatmapset: Optional[Dict[str, Any]] = osu_metadata.get_cached("beatmapset", beatmap["beatmapset_id"])
+    title: str = f"{beatmapset['artist']} - {beatmapset['title']} " if beatmapset else ""
+    return escape_markdown(f"{title}[{beatmap['version']}]") + f" ★{beatmap['difficulty_rating']:.2f}"
+
+def format_beatmapset(beatmapset_id: Optional[int]) -> Optional[str]:
+    beatmapset: Optional[Dict[str, Any]] = osu_metadata.get_cached("beatmapset", beatmapset_id)
+    if beatmapset is None:
+        return None
+    return escape_markdown(f"{beatmapset['artist']} - {beatmapset['title']}") + f" (mapped by {escape_markdown(beatmapset['creator'])})"
+
+def format_user(user_id: Optional[int]) -> Optional[str]:
+    user: Optional[Dict[str, Any]] = osu_metadata.get_cached("user", user_id)
+    return escape_markdown(user["username"]) if user else None
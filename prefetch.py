@@ -0,0 +1,56 @@
+import asyncio
+import traceback
+from typing import Awaitable, Callable, Generic, List, Optional, TypeVar
+
+T = TypeVar('T')
+
+
+class RoundPrefetcher(Generic[T]):
+    # Keeps up to `depth` rounds prepared ahead of time. `prepare` returns None once there is nothing left to prepare.
+    def __init__(self, prepare: Callable[[], Awaitable[Optional[T]]], depth: int = 1) -> None:
+        self.prepare: Callable[[], Awaitable[Optional[T]]] = prepare
+        self.depth: int = depth
+        self.ready: asyncio.Queue = asyncio.Queue()
+        self.slots: asyncio.Semaphore = asyncio.Semaphore(depth)
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    async def run(self) -> None:
+        try:
+            while True:
+                # Only prepare a round once there is room for it, so at most `depth` are ever held
+                await self.slots.acquire()
+                prepared: Optional[T] = await self.prepare()
+                await self.ready.put(prepared)
+                if prepared is None:
+                    return
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            print(f"Round preparation failed:\n{traceback.format_exc()}")
+            await self.ready.put(None)
+
+    async def get(self) -> Optional[T]:
+        self.start()
+        prepared: Optional[T] = await self.ready.get()
+        self.slots.release()
+        return prepared
+
+    @property
+    def ready_count(self) -> int:
+        return self.ready.qsize()
+
+    def stop(self) -> None:
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+
+    def drain(self) -> List[T]:
+        leftover: List[T] = []
+        while not self.ready.empty():
+            prepared: Optional[T] = self.ready.get_nowait()
+            if prepared is not None:
+                leftover.append(prepared)
+        return leftover
@@ -0,0 +1,94 @@
+import random
+from typing import Dict, Generic, List, Optional, Sequence, Tuple, TypeVar
+
+T = TypeVar('T')
+
+
+class Sampler(Generic[T]):
+    # Draws items without replacement in O(k). Uniform draws swap drawn items behind a shrinking boundary,
+    # weighted draws (items must be hashable) use an alias table that is rebuilt once half of its weight has been drawn.
+    def __init__(self, items: Sequence[T], weights: Optional[Sequence[float]] = None) -> None:
+        self.items: List[T] = list(items)
+        self.weights: Optional[List[float]] = list(weights) if weights is not None else None
+        self.remaining: int = len(self.items)
+
+        if self.weights is not None:
+            if len(self.weights) != len(self.items):
+                raise ValueError("Need exactly one weight per item")
+            self.positions: Dict[T, int] = {item: i for i, item in enumerate(self.items)}
+            self.used: List[bool] = [weight <= 0 for weight in self.weights]
+            self.remaining = self.used.count(False)
+            self.build()
+
+    def __len__(self) -> int:
+        return self.remaining
+
+    def build(self) -> None:
+        # Vose's alias method over the items that can still be drawn
+        candidates: List[int] = [i for i, used in enumerate(self.used) if not used]
+        total: float = sum(self.weights[i] for i in candidates)
+        n: int = len(candidates)
+        prob: List[float] = [1.0] * n
+        alias: List[int] = list(range(n))
+        scaled: List[float] = [self.weights[i] * n / total for i in candidates] if total else []
+
+        small: List[int] = [j for j, p in enumerate(scaled) if p < 1]
+        large: List[int] = [j for j, p in enumerate(scaled) if p >= 1]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            prob[s] = scaled[s]
+            alias[s] = l
+            scaled[l] -= 1 - scaled[s]
+            (small if scaled[l] < 1 else large).append(l)
+
+        self.table: Tuple[List[int], List[float], List[int]] = (candidates, prob, alias)
+        self.table_weight: float = total
+        self.drawn_weight: float = 0
+        self.stale: bool = False
+
+    def draw_weighted(self) -> int:
+        if self.stale or self.drawn_weight * 2 > self.table_weight:
+            self.build()
+
+        candidates, prob, alias = self.table
+        while True:
+            j: int = random.randrange(len(candidates))
+            i: int = candidates[j] if random.random() < prob[j] else candidates[alias[j]]
+            # Items drawn since the last rebuild are still in the table, skip them
+            if not self.used[i]:
+                self.used[i] = True
+                self.drawn_weight += self.weights[i]
+                return i
+
+    def sample(self, k: int) -> List[T]:
+        if k > self.remaining:
+            raise ValueError("Sample larger than the remaining items")
+
+        drawn: List[T] = []
+        for _ in range(k):
+            if self.weights is not None:
+                drawn.append(self.items[self.draw_weighted()])
+            else:
+                j: int = random.randrange(self.remaining)
+                last: int = self.remaining - 1
+                self.items[j], self.items[last] = self.items[last], self.items[j]
+                drawn.append(self.items[last])
+            self.remaining -= 1
+
+        return drawn
+
+    def put_back(self, items: Sequence[T]) -> None:
+        # Makes previously drawn items available again
+        for item in items:
+            if self.weights is not None:
+                i: int = self.positions[item]
+                if self.used[i] and self.weights[i] > 0:
+                    self.used[i] = False
+                    self.stale = True
+                    self.remaining += 1
+            else:
+                if self.remaining < len(self.items):
+                    self.items[self.remaining] = item
+                else:
+                    self.items.append(item)
+                self.remaining += 1
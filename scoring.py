@@ -0,0 +1,176 @@
+import math
+import time
+import numpy as np
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+ArrayLike = Union[float, np.ndarray]
+
+
+class Scoreboard:
+    # One game's guesses, guess times and running totals (points or HP) kept in arrays indexed by slot, so a round is
+    # scored for the whole lobby in one vectorized call. The deltas of the last scored round are kept for rendering
+    def __init__(self, player_ids: Iterable[int] = (), starting_total: float = 0, capacity: int = 16) -> None:
+        self.starting_total: float = starting_total
+        self.ids: List[int] = []
+        self.slots: Dict[int, int] = {}
+        self.guessed_count: int = 0
+        self.arrays: Dict[str, np.ndarray] = {
+            "totals": np.zeros(capacity),
+            "deltas": np.zeros(capacity),
+            "guesses": np.zeros(capacity, dtype=np.int64),
+            "guessed": np.zeros(capacity, dtype=bool),
+            "guess_times": np.zeros(capacity),
+        }
+        for player_id in player_ids:
+            self.add(player_id)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, player_id: int) -> bool:
+        return player_id in self.slots
+
+    # Views over the slots in use, writes go through to the arrays
+    @property
+    def totals(self) -> np.ndarray:
+        return self.arrays["totals"][:len(self.ids)]
+
+    @property
+    def deltas(self) -> np.ndarray:
+        return self.arrays["deltas"][:len(self.ids)]
+
+    @property
+    def guesses(self) -> np.ndarray:
+        return self.arrays["guesses"][:len(self.ids)]
+
+    @property
+    def guessed(self) -> np.ndarray:
+        return self.arrays["guessed"][:len(self.ids)]
+
+    @property
+    def guess_times(self) -> np.ndarray:
+        return self.arrays["guess_times"][:len(self.ids)]
+
+    def add(self, player_id: int) -> int:
+        slot: Optional[int] = self.slots.get(player_id)
+        if slot is not None:
+            return slot
+
+        slot = len(self.ids)
+        if slot == len(self.arrays["totals"]):
+            # Doubling keeps late joiners amortized O(1)
+            for name, array in self.arrays.items():
+                grown: np.ndarray = np.zeros(slot * 2, dtype=array.dtype)
+                grown[:slot] = array
+                self.arrays[name] = grown
+
+        self.ids.append(player_id)
+        self.slots[player_id] = slot
+        self.arrays["totals"][slot] = self.starting_total
+        return slot
+
+    def guess(self, player_id: int, guess: int, at: Optional[float] = None) -> bool:
+        # Returns True for the player's first guess this round, a changed guess replaces the old one and its time
+        slot: int = self.add(player_id)
+        first: bool = not self.arrays["guessed"][slot]
+        self.arrays["guesses"][slot] = guess
+        self.arrays["guess_times"][slot] = time.time() if at is None else at
+        self.arrays["guessed"][slot] = True
+        if first:
+            self.guessed_count += 1
+        return first
+
+    def get_guess(self, slot: int) -> Optional[int]:
+        return int(self.arrays["guesses"][slot]) if self.arrays["guessed"][slot] else None
+
+    def get_guesses(self, default: int = 0) -> np.ndarray:
+        return np.where(self.guessed, self.guesses, default)
+
+    def reset_guesses(self) -> None:
+        self.arrays["guessed"][:] = False
+        self.guessed_count = 0
+
+    def apply(self, deltas: np.ndarray, mask: Optional[np.ndarray] = None) -> np.ndarray:
+        # Adds a round's deltas to the totals of the players in mask, or everyone, and keeps them for rendering
+        applied: np.ndarray = self.deltas
+        applied[:] = deltas if mask is None else np.where(mask, deltas, 0)
+        self.totals[:] += applied
+        return applied
+
+    def get_ranking(self) -> np.ndarray:
+        # Slots by total, highest first, ties keep join order
+        return np.argsort(-self.totals, kind="stable")
+
+
+def get_rank_damage(guesses: np.ndarray, real_rank: ArrayLike, round: ArrayLike) -> np.ndarray:
+    # Replay roulette: sqrt(round) * 1000 * |log2(guess) - log2(real_rank)|, truncated towards zero
+    return np.trunc(np.abs(np.log2(np.maximum(guesses, 1)) - np.log2(real_rank)) * (1000 * np.sqrt(round)))
+
+def get_speed_points(guess_times: np.ndarray, round_start: float, guess_time: float, time_bonus: float) -> np.ndarray:
+    # bg_game: one point for the right answer and up to time_bonus more the sooner it came in
+    return np.round(1 + (guess_time - np.round(guess_times - round_start, 3)) * time_bonus / guess_time, 2)
+
+def simulate_rank_damage(guesses: np.ndarray, real_ranks: np.ndarray, starting_hp: float) -> Tuple[np.ndarray, np.ndarray]:
+    # Plays out a whole replay roulette game from a (rounds, players) guess matrix at once. Returns every player's final HP
+    # and the round they were eliminated in, 0 for players who survived
+    rounds: np.ndarray = np.arange(1, len(real_ranks) + 1)[:, None]
+    damage: np.ndarray = get_rank_damage(guesses, np.asarray(real_ranks)[:, None], rounds)
+    hp: np.ndarray = starting_hp - np.cumsum(damage, axis=0)
+    out: np.ndarray = hp <= 0
+    eliminated_round: np.ndarray = np.where(out.any(axis=0), out.argmax(axis=0) + 1, 0)
+    # Eliminated players stop taking damage, their HP is whatever the eliminating round left them with
+    final_round: np.ndarray = np.where(eliminated_round > 0, eliminated_round, len(real_ranks)) - 1
+    return hp[final_round, np.arange(hp.shape[1])], eliminated_round
+
+
+if __name__ == "__main__":
+    import random
+
+    # Benchmark: python scoring.py
+    # The per-player paths are the ones the games used before this module
+    def python_rank_damage(guesses: List[int], real_rank: int, round: int) -> List[int]:
+        return [int(abs(math.log(guess or 1, 2) - math.log(real_rank, 2)) * (1000 * math.sqrt(round))) for guess in guesses]
+
+    def python_speed_points(guess_times: List[float], round_start: float, guess_time: int, time_bonus: float) -> List[float]:
+        return [round(1 + (guess_time - round(t - round_start, 3)) * time_bonus / guess_time, 2) for t in guess_times]
+
+    def best_of(function, repeats: int) -> float:
+        best: float = float("inf")
+        for _ in range(repeats):
+            start: float = time.perf_counter()
+            function()
+            best = min(best, time.perf_counter() - start)
+        return best
+
+    for players in (10, 100, 1_000, 10_000, 100_000):
+        guesses: List[int] = [int(10 ** random.uniform(0, 6)) for _ in range(players)]
+        guess_times: List[float] = [random.uniform(0, 30) for _ in range(players)]
+        guess_array: np.ndarray = np.array(guesses)
+        time_array: np.ndarray = np.array(guess_times)
+        repeats: int = max(3, 100_000 // players)
+
+        python_damage: float = best_of(lambda: python_rank_damage(guesses, 12345, 7), repeats)
+        numpy_damage: float = best_of(lambda: get_rank_damage(guess_array, 12345, 7), repeats)
+        python_points: float = best_of(lambda: python_speed_points(guess_times, 0, 30, 0.25), repeats)
+        numpy_points: float = best_of(lambda: get_speed_points(time_array, 0, 30, 0.25), repeats)
+        print(f"{players:>7,} players | damage: python {python_damage * 1e6:>9.1f}us, numpy {numpy_damage * 1e6:>7.1f}us"
+              f" | points: python {python_points * 1e6:>9.1f}us, numpy {numpy_points * 1e6:>7.1f}us")
+
+    # A tournament: many games of many rounds, played out per player per round against the whole matrix at once
+    games, rounds, players = 100, 50, 200
+    all_guesses: np.ndarray = (10 ** np.random.uniform(0, 6, (games, rounds, players))).astype(np.int64)
+    all_ranks: np.ndarray = (10 ** np.random.uniform(0, 6, (games, rounds))).astype(np.int64)
+
+    start = time.perf_counter()
+    for game in range(games):
+        hp: List[int] = [10_000] * players
+        for round_index in range(rounds):
+            damage = python_rank_damage(all_guesses[game, round_index].tolist(), int(all_ranks[game, round_index]), round_index + 1)
+            hp = [h - d if h > 0 else h for h, d in zip(hp, damage)]
+    python_tournament: float = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for game in range(games):
+        simulate_rank_damage(all_guesses[game], all_ranks[game], 10_000)
+    numpy_tournament: float = time.perf_counter() - start
+    print(f"{games} games x {rounds} rounds x {players} players: python {python_tournament * 1e3:.1f}ms, numpy {numpy_tournament * 1e3:.1f}ms")
@@ -0,0 +1,88 @@
+import os
+import json
+import time
+import asyncio
+import tempfile
+from typing import Any, Dict, List, Tuple
+from edit_scheduler import edit_scheduler
+from osu_metadata import osu_metadata
+from cogs.osu_replay_roulette import VideoManifest, video_pool
+from cogs.osu_replay_roulette.cog import GameView
+
+
+class FakeMessage:
+    # Stands in for the game's discord message and keeps every edit made to it
+    def __init__(self) -> None:
+        self.id: int = 0
+        self.attachments: List[Any] = []
+        self.edits: List[Dict[str, Any]] = []
+
+    async def edit(self, **kwargs: Any) -> None:
+        self.edits.append(kwargs)
+
+
+def write_clips(directory: str, ranks: List[int]) -> None:
+    for rank in ranks:
+        with open(f"{directory}/{rank}.mp4", "wb") as f:
+            f.write(b"\0" * 1024)
+        with open(f"{directory}/{rank}.json", "w") as f:
+            json.dump({"map_id": rank, "player_id": rank, "transcoded": {"bitrate": 0}}, f)
+
+
+async def play_smoke_game(directory: str, ranks: List[int], players: List[int]) -> None:
+    # Plays a whole game against a throwaway clip directory, every player guessing each clip's rank exactly
+    write_clips(directory, ranks)
+    video_pool.manifest = VideoManifest(path=f"{directory}/manifest.db", video_directory=directory)
+    edit_scheduler.min_interval = 0
+    # Names and titles are cached up front so the check never reaches the api
+    osu_metadata.loaded = True
+    for rank in ranks:
+        osu_metadata.entries[("beatmap", rank)] = ({"id": rank, "beatmapset_id": rank, "version": "Insane", "difficulty_rating": 5.0, "total_length": 90}, time.time())
+        osu_metadata.entries[("beatmapset", rank)] = ({"id": rank, "artist": "Artist", "title": "Title", "creator": "Mapper"}, time.time())
+        osu_metadata.entries[("user", rank)] = ({"id": rank, "username": f"player{rank}", "country_code": "US"}, time.time())
+
+    await video_pool.load()
+    assert video_pool.depth == len(ranks), f"pool loaded {video_pool.depth} of {len(ranks)} clips"
+
+    message: FakeMessage = FakeMessage()
+    game: GameView = GameView(set(players), message)
+    await game.next_round()
+
+    played: int = 0
+    while game.state == "getting_guesses":
+        assert "file" in message.edits[-1], f"round {game.round} went out without its clip"
+        played += 1
+        for player in players:
+            await game.player_guess(player, game.real_rank)
+        assert game.state == "showing_answers", f"round {game.round} didn't move on once everyone guessed"
+        game.timer.cancel()
+        await game.advance()
+
+    assert played == len(ranks), f"played {played} of {len(ranks)} rounds"
+    assert message.edits[-1]["embed"].title == "🏁 Game Over!", "game didn't end once the clips ran out"
+    assert f"player{game.real_rank}" in str(message.edits[-1]["embed"].to_dict()), "cached usernames weren't shown"
+    assert not video_pool.holders, f"clips still reserved after the game: {list(video_pool.holders)}"
+    assert not [name for name in os.listdir(directory) if name.endswith(".mp4")], "played clips weren't deleted"
+    print(f"Replay roulette smoke check passed: {played} rounds, {len(message.edits)} edits")
+
+
+async def run_smoke_check(ranks: List[int] = [1000, 20_000, 300_000], players: List[int] = [1, 2]) -> None:
+    # The shared singletons the game is pointed away from are put back afterwards, however the check ends
+    manifest: VideoManifest = video_pool.manifest
+    min_interval: float = edit_scheduler.min_interval
+    loaded: bool = osu_metadata.loaded
+    entries: Dict[Tuple[str, int], Any] = dict(osu_metadata.entries)
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            await play_smoke_game(directory, ranks, players)
+        finally:
+            video_pool.manifest = manifest
+            edit_scheduler.min_interval = min_interval
+            osu_metadata.loaded = loaded
+            osu_metadata.entries.clear()
+            osu_metadata.entries.update(entries)
+
+
+if __name__ == "__main__":
+    # python -m scripts.replay_roulette_smoke, from the repository root
+    asyncio.run(run_smoke_check())
@@ -0,0 +1,107 @@
+import time
+import heapq
+import asyncio
+import itertools
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+
+class Timer:
+    def __init__(self, deadline: float, callback: Callable[..., Awaitable[Any]], args: Tuple[Any, ...]) -> None:
+        self.deadline: float = deadline
+        self.callback: Callable[..., Awaitable[Any]] = callback
+        self.args: Tuple[Any, ...] = args
+        self.cancelled: bool = False
+        self.fired: bool = False
+
+    def cancel(self) -> None:
+        if not self.cancelled and not self.fired:
+            self.cancelled = True
+            timer_service.cancelled += 1
+
+    @property
+    def remaining(self) -> float:
+        return max(0.0, self.deadline - time.monotonic())
+
+
+class TimerService:
+    # One heap and one task for every game's deadlines. Cancelled timers stay in the heap until they reach the top
+    # or until they make up most of it, so cancelling is O(1)
+    _instance: Optional['TimerService'] = None
+
+    def __init__(self) -> None:
+        self.heap: List[Tuple[float, int, Timer]] = []
+        self.counter = itertools.count()
+        self.cancelled: int = 0
+        self.wakeup: Optional[asyncio.Event] = None
+        self.task: Optional[asyncio.Task] = None
+        self.running: Set[asyncio.Task] = set()
+        self.fired: int = 0
+
+    def schedule(self, delay: float, callback: Callable[..., Awaitable[Any]], *args: Any) -> Timer:
+        timer = Timer(time.monotonic() + delay, callback, args)
+        self.push(timer)
+        return timer
+
+    def reschedule(self, timer: Timer, delay: float) -> Timer:
+        timer.cancel()
+        return self.schedule(delay, timer.callback, *timer.args)
+
+    def push(self, timer: Timer) -> None:
+        earliest: Optional[float] = self.heap[0][0] if self.heap else None
+        heapq.heappush(self.heap, (timer.deadline, next(self.counter), timer))
+
+        if self.cancelled > 64 and self.cancelled * 2 > len(self.heap):
+            self.compact()
+
+        if self.task is None or self.task.done():
+            self.wakeup = asyncio.Event()
+            self.task = asyncio.create_task(self.run())
+        elif earliest is None or timer.deadline < earliest:
+            self.wakeup.set()
+
+    def compact(self) -> None:
+        self.heap = [entry for entry in self.heap if not entry[2].cancelled]
+        heapq.heapify(self.heap)
+        self.cancelled = 0
+
+    async def run(self) -> None:
+        while self.heap:
+            deadline, _, timer = self.heap[0]
+            if timer.cancelled:
+                heapq.heappop(self.heap)
+                self.cancelled -= 1
+                continue
+
+            delay: float = deadline - time.monotonic()
+            if delay > 0:
+                # Sleeps until the earliest deadline, or until an earlier timer is pushed
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            heapq.heappop(self.heap)
+            timer.fired = True
+            self.fired += 1
+            task = asyncio.create_task(self.fire(timer))
+            self.running.add(task)
+            task.add_done_callback(self.running.discard)
+
+    async def fire(self, timer: Timer) -> None:
+        try:
+            await timer.callback(*timer.args)
+        except Exception as e:
+            print(f"Timer callback {getattr(timer.callback, '__qualname__', timer.callback)} failed: {e!r}")
+
+    def get_stats(self) -> Dict[str, int]:
+        return {"scheduled": len(self.heap) - self.cancelled, "cancelled": self.cancelled, "running": len(self.running), "fired": self.fired}
+
+    @classmethod
+    def get_instance(cls) -> 'TimerService':
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+timer_service = TimerService.get_instance()
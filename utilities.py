@@ -1,11 +1,132 @@
 from ossapi import OssapiAsync, Scope, Beatmap, User, Score, GameMode
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+import asyncio
+import inspect
+import time
 from config import config
 
 
-def get_osu_api() -> OssapiAsync:
-    api = OssapiAsync(client_id=config.get_api_key('osu_id'), client_secret=config.get_api_key('osu_secret'))
-    return api
-    
+class RateLimiter:
+    # Token bucket, osu! allows 1200 requests a minute with a short burst on top
+    def __init__(self, requests_per_minute: float, burst: int) -> None:
+        self.rate: float = requests_per_minute / 60
+        self.capacity: int = burst
+        self.tokens: float = burst
+        self.updated: float = time.monotonic()
+        self.lock: asyncio.Lock = asyncio.Lock()
+
+    async def acquire(self) -> float:
+        async with self.lock:
+            now: float = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+
+            wait: float = (1 - self.tokens) / self.rate
+            await asyncio.sleep(wait)
+            self.tokens = 0
+            self.updated = time.monotonic()
+            return wait
+
+@dataclass
+class EndpointStats:
+    calls: int = 0
+    errors: int = 0
+    throttled: int = 0
+    throttle_wait: float = 0
+    total_latency: float = 0
+    max_latency: float = 0
+
+    def json(self):
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "throttled": self.throttled,
+            "throttle_wait": self.throttle_wait,
+            "avg_latency": self.total_latency / self.calls if self.calls else 0,
+            "max_latency": self.max_latency,
+        }
+
+class OsuApiClient:
+    _instance: Optional['OsuApiClient'] = None
+
+    def __init__(self, requests_per_minute: float = 1000, burst: int = 60, refresh_margin: float = 10 * 60) -> None:
+        self.api: Optional[OssapiAsync] = None
+        self.expires_at: float = 0
+        self.refresh_margin: float = refresh_margin
+        self.limiter: RateLimiter = RateLimiter(requests_per_minute, burst)
+        self.auth_lock: asyncio.Lock = asyncio.Lock()
+        self.stats: Dict[str, EndpointStats] = {}
+
+    async def get_api(self) -> OssapiAsync:
+        async with self.auth_lock:
+            if self.api is None or time.time() > self.expires_at - self.refresh_margin:
+                await self.refresh()
+            return self.api
+
+    async def refresh(self) -> None:
+        if self.api is not None:
+            # Drop the cached token so the new client does a fresh client credentials exchange
+            try:
+                OssapiAsync.remove_token(self.api.token_key)
+            except FileNotFoundError:
+                pass
+
+        # OssapiAsync fetches its token synchronously, keep that off the event loop
+        self.api = await asyncio.to_thread(OssapiAsync, client_id=config.get_api_key('osu_id'), client_secret=config.get_api_key('osu_secret'))
+        self.expires_at = self.api.session.token.get("expires_at", time.time() + 24 * 60 * 60)
+        print("Authenticated with the osu! api")
+
+    async def request(self, endpoint: str, *args, **kwargs) -> Any:
+        api = await self.get_api()
+        stats: EndpointStats = self.stats.setdefault(endpoint, EndpointStats())
+
+        waited: float = await self.limiter.acquire()
+        if waited > 0:
+            stats.throttled += 1
+            stats.throttle_wait += waited
+
+        start: float = time.perf_counter()
+        try:
+            return await getattr(api, endpoint)(*args, **kwargs)
+        except Exception:
+            stats.errors += 1
+            raise
+        finally:
+            latency: float = time.perf_counter() - start
+            stats.calls += 1
+            stats.total_latency += latency
+            stats.max_latency = max(stats.max_latency, latency)
+
+    def __getattr__(self, name: str):
+        # Any OssapiAsync endpoint can be called on the client, e.g. await client.user(...)
+        endpoint = getattr(OssapiAsync, name, None)
+        if endpoint is None or not inspect.iscoroutinefunction(inspect.unwrap(endpoint)):
+            raise AttributeError(name)
+
+        async def call(*args, **kwargs):
+            return await self.request(name, *args, **kwargs)
+        return call
+
+    def get_stats(self) -> Dict[str, Dict[str, float]]:
+        return {endpoint: stats.json() for endpoint, stats in self.stats.items()}
+
+    @classmethod
+    def get_instance(cls) -> 'OsuApiClient':
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+osu_api = OsuApiClient.get_instance()
+
+
+def get_osu_api() -> OsuApiClient:
+    return osu_api
+
 async def get_osu_user(name_or_id: str) -> User:
     api = get_osu_api()
     try:
@@ -13,4 +134,4 @@ async def get_osu_user(name_or_id: str) -> User:
         return user
     except Exception as e:
         return None
-    
\ No newline at end of file
+